@@ -0,0 +1,116 @@
+"""Compares the memory usage and sorting time of image records with the previous layout
+(a frozen dataclass with a `__dict__` that references its data source
+and computes its sort key on each comparison) for a synthetic set of animated frames.
+The source files are shared by both layouts, so only the records themselves are measured.
+
+Run from the repository root:
+    python -m benchmarks.image_records
+"""
+
+import gc
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from pokemon_image_dataset.form import POKEMON_FORMS, PokemonForm, PokemonImage, sort_images
+
+NUM_FRAMES = 1_000_000
+FRAMES_PER_IMAGE = 20
+SPRITE_SETS = ['3d-battlers-animated', 'emerald-animated', 'crystal-animated']
+
+
+class DataSource:
+    pass
+
+
+@dataclass(frozen=True)
+class DictPokemonImage:
+    data_source: DataSource
+    form: PokemonForm
+    source_file: Path
+    sprite_set: str
+    frame: Optional[int] = None
+    format: str = '.png'
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+    @property
+    def sort_key(self) -> tuple:
+        return (
+            self.data_source.__class__.__name__,
+            self.form.ndex,
+            self.form.form_name,
+            self.sprite_set,
+            self.frame if self.frame is not None else 0,
+        )
+
+
+def get_forms() -> List[PokemonForm]:
+    return [form for forms in POKEMON_FORMS.values() for form in forms]
+
+
+def get_source_files(forms: List[PokemonForm]) -> List[Path]:
+    return [
+        Path('tmp') / SPRITE_SETS[i % len(SPRITE_SETS)] / f'{forms[i % len(forms)].name}--{i}.png'
+        for i in range(NUM_FRAMES)
+    ]
+
+
+def create_records(create: Callable, forms: List[PokemonForm], source_files: List[Path]) -> list:
+    return [
+        create(
+            form=forms[(i // FRAMES_PER_IMAGE) % len(forms)],
+            source_file=source_file,
+            # Like the result of `filename.parent.name`, each name is a new string.
+            sprite_set=source_file.parent.name,
+            frame=i % FRAMES_PER_IMAGE,
+        )
+        for i, source_file in enumerate(source_files)
+    ]
+
+
+def measure(
+    name: str,
+    create: Callable,
+    forms: List[PokemonForm],
+    source_files: List[Path],
+    sort: Callable = sorted,
+) -> None:
+    gc.collect()
+    tracemalloc.start()
+    records = create_records(create, forms, source_files)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = timeit.timeit(lambda: sort(records), number=1)
+    print(
+        f'{name}: {size / len(records):.0f} bytes per record, '
+        f'{size / 2**20:.0f}MiB total, sorting {seconds:.2f}s'
+    )
+
+
+def main():
+    forms = get_forms()
+    source_files = get_source_files(forms)
+    data_source = DataSource()
+    print(f'{NUM_FRAMES} frames')
+    measure(
+        'dict',
+        lambda **kwargs: DictPokemonImage(data_source=data_source, **kwargs),
+        forms,
+        source_files,
+    )
+    measure(
+        'slots',
+        lambda **kwargs: PokemonImage(data_source_name='DataSource', **kwargs),
+        forms,
+        source_files,
+        sort=sort_images,
+    )
+
+
+if __name__ == '__main__':
+    main()
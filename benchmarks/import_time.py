@@ -0,0 +1,64 @@
+"""Measures the import time of the package entry points with `python -X importtime`.
+Each entry point is imported in a fresh interpreter, so nothing is cached between them.
+The slowest imported packages show which dependencies are loaded eagerly.
+
+Run from the repository root:
+    python -m benchmarks.import_time
+"""
+
+import subprocess
+import sys
+from typing import Dict
+
+ENTRY_POINTS = [
+    'pokemon_image_dataset',
+    'pokemon_image_dataset.form',
+    'pokemon_image_dataset.data_sources',
+    'pokemon_image_dataset.normalize',
+    'pokemon_image_dataset.dataset',
+]
+REPEAT = 5
+NUM_SLOWEST = 5
+
+
+def import_times(code: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds of each module imported by `code`."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    # Modules imported by the interpreter itself.
+    startup = set(import_times('pass'))
+    for module in ENTRY_POINTS:
+        totals = []
+        packages: Dict[str, int] = {}
+        for _ in range(REPEAT):
+            times = import_times(f'import {module}')
+            totals.append(times[module])
+            run_packages: Dict[str, int] = {}
+            for name, cumulative in times.items():
+                package = name.split('.')[0]
+                if name not in startup and package != 'pokemon_image_dataset':
+                    # The outermost module of a package has the largest cumulative time.
+                    run_packages[package] = max(run_packages.get(package, 0), cumulative)
+            for package, cumulative in run_packages.items():
+                packages[package] = min(packages.get(package, cumulative), cumulative)
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:NUM_SLOWEST]
+        print(f'{module}: {min(totals) / 1000:.1f}ms')
+        for package, cumulative in slowest:
+            print(f'    {package}: {cumulative / 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
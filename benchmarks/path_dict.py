@@ -0,0 +1,59 @@
+"""Compares looking up the form of each file by scanning all keys with `Path.match`
+(the previous implementation) to the compiled `PathDict` index,
+using the assignments of the battlers data source.
+
+Run from the repository root:
+    python -m benchmarks.path_dict
+"""
+
+import timeit
+from pathlib import Path
+from typing import List
+
+from pokemon_image_dataset.data_sources import PathDict
+from pokemon_image_dataset.data_sources.battlers import BattlersDataSource
+
+REPEAT = 3
+LINEAR_SAMPLE = 10
+"""Only every n-th path is looked up linearly because that takes minutes otherwise."""
+
+
+def get_linear(path_dict: PathDict, path: Path):
+    for key, val in path_dict.items():
+        if path.match(key) or path.with_suffix('').match(key):
+            return val
+    return None
+
+
+def get_paths(path_dict: PathDict, root: Path) -> List[Path]:
+    """A file for each key and as many files without an assigned form."""
+    paths = [root / f'{key}.png' for key in path_dict.keys()]
+    return paths + [path.with_name(f'_{path.name}') for path in paths]
+
+
+def main():
+    data_source = BattlersDataSource(tmp_dir=Path('tmp'))
+    path_dict = data_source.assign_forms()
+    paths = get_paths(path_dict, data_source.root)
+    sample = paths[::LINEAR_SAMPLE]
+    assert all(path_dict[path] is get_linear(path_dict, path) for path in sample)
+
+    linear = min(timeit.repeat(
+        lambda: [get_linear(path_dict, path) for path in sample],
+        number=1,
+        repeat=REPEAT,
+    )) / len(sample)
+    compiled = min(timeit.repeat(
+        lambda: [path_dict[path] for path in paths],
+        number=1,
+        repeat=REPEAT,
+    )) / len(paths)
+    print(
+        f'{len(paths)} paths, {len(path_dict)} keys: '
+        f'linear {linear * 1e6:.1f}us, compiled {compiled * 1e6:.1f}us per lookup, '
+        f'speedup {linear / compiled:.1f}x'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Compares scaling images one at a time with skimage's `rescale` (the previous implementation)
+to scaling stacks of equally shaped images at once with cached resampling weights.
+
+Run from the repository root:
+    python -m benchmarks.resampling
+"""
+
+import timeit
+
+import numpy as np
+from skimage.transform import rescale
+
+from pokemon_image_dataset.normalize import get_resampling_weights, scale
+
+NUM_IMAGES = 500
+# (cropped shape, scaling factor) as they occur in typical sprite sets
+CASES = [
+    ((80, 70), 94 / 80),
+    ((96, 90), 94 / 96),
+    ((475, 390), 94 / 475),
+]
+REPEAT = 3
+
+
+def scale_one_by_one(imgs: np.ndarray, factor: float) -> None:
+    for img in imgs:
+        rescale(img, factor, multichannel=True, anti_aliasing=True)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for shape, factor in CASES:
+        num_images = NUM_IMAGES if max(shape) < 200 else NUM_IMAGES // 10
+        imgs = rng.integers(0, 256, (num_images, *shape, 3), dtype=np.uint8)
+        get_resampling_weights.cache_clear()
+
+        one_by_one = min(timeit.repeat(
+            lambda: scale_one_by_one(imgs, factor),
+            number=1,
+            repeat=REPEAT,
+        ))
+        batched = min(timeit.repeat(
+            lambda: scale(imgs, factor),
+            number=1,
+            repeat=REPEAT,
+        ))
+        print(
+            f'{num_images} images of {shape[0]}x{shape[1]}, factor {factor:.3f}: '
+            f'one by one {one_by_one:.3f}s, batched {batched:.3f}s, '
+            f'speedup {one_by_one / batched:.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,127 +1,269 @@
-import filecmp
+import argparse
 import json
-import re
-import shutil
-from concurrent.futures import ThreadPoolExecutor
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from pprint import pprint
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-from skimage.color import gray2rgb, rgba2rgb
-from skimage.io import imread
-from skimage.transform import rescale
 from tqdm import tqdm
-from wand.image import Image
 
-from pokemon_image_dataset.form import PokemonImage
+from pokemon_image_dataset.cache import BBoxIndex, ContentCache
+from pokemon_image_dataset.dedup import (DUPLICATE_POLICIES, NEAR_DUPLICATE_THRESHOLD, exclude_images,
+                                         link_duplicates, remove_duplicates, remove_near_duplicate_frames)
+from pokemon_image_dataset.export import export_packed, export_shards, get_data_repo_path
+from pokemon_image_dataset.form import BasePokemonImage, PokemonImage, sort_images
+from pokemon_image_dataset.normalize import FINAL_SIZE, PADDING, normalize_files
 from pokemon_image_dataset.data_sources import (BattlersDataSource, DataSource, SpriteSetDataSource,
                                                 veekun)
-from pokemon_image_dataset.utils import (FORM_NAME_DELIMITER,
-                                         NAME_DELIMITER, dename, extent_gravity_center,
-                                         get_bbox, get_scaling_factor, name)
+from pokemon_image_dataset.utils import NAME_DELIMITER, BBox, capture_output, dename, sha256sum
 
 BASE_DIR = Path(__file__).parent
 TMP_DIR = BASE_DIR / 'tmp'
+NORMALIZATION_CACHE_DIR = TMP_DIR / 'normalization-cache'
+BBOX_INDEX_FILE = TMP_DIR / 'bboxes.json'
 DATA_REPO_DIR = BASE_DIR / 'pokemon-image-dataset-files'
 STATS_FILE = BASE_DIR / 'stats.json'
 
-PADDING = 1
-# This values are arbitrary such that 48x48 can be upscaled well and only 128x128 needs to be downscaled.
-# This way, we don't loose to much information while also avoiding unnecessarily large images.
-FINAL_SIZE = (96, 96)
+# Must be incremented whenever `normalize_images` changes its output
+# so that cached results of older versions are not used anymore.
+NORMALIZATION_VERSION = 4
 
 
-def run_data_sources(data_sources: List[DataSource]) -> None:
-    for data_source in data_sources:
-        print(f'processing data source {data_source.__class__.__name__}')
-        data_source.run(force=False)
-
-
-# def remove_adjacent_duplicates(data_sources: List[SpriteSetDataSource]) -> None:
-#     """Finds and removes duplicates within each data source, not across data sources."""
-#
-#     def filename_key(filename: Path) -> tuple[int, str, int]:
-#         ndex: str
-#         form: str
-#         frame: int
-#
-#         ndex, *rest = re.split(
-#             f'{FORM_NAME_DELIMITER}|{NAME_DELIMITER}',
-#             filename.stem,
-#         )
-#         if rest:
-#             try:
-#                 frame = int(rest[-1])
-#                 form = name(*rest[:-1])
-#             except ValueError:
-#                 frame = -1
-#                 form = name(*rest)
-#         else:
-#             frame = -1
-#             form = ''
-#         return int(ndex), form, frame
-#
-#     for data_source in data_sources:
-#         print(f'removing duplicates for {data_source.__class__.__name__}')
-#         for src in data_source.sprite_sets:
-#             duplicates = set()
-#             dest = data_source.get_dest(src)
-#             print('searching for duplicates in', dest)
-#             # TODO: use data_source.images so only relevant images are regarded!
-#             files = list(sorted(
-#                 dest.iterdir(),
-#                 key=filename_key,
-#             ))
-#             for a, b in tqdm(zip(files[:-1], files[1:]), total=len(files) - 1):
-#                 if filecmp.cmp(a, b, shallow=False):
-#                     duplicates.add(b)
-#             for file in sorted(duplicates):
-#                 file.unlink()
-#                 print('removed duplicate', file)
-
-
-def normalize_image_sizes(data_sources: List[DataSource]) -> None:
-    for data_source in data_sources:
-        print(f'normalizing image sizes for {data_source.__class__.__name__}')
-        # for filename in tqdm(sorted(data_source.get_files())):
-        for poke_image in sorted(data_source.images):
-            filename = poke_image.source_file
-            bbox = poke_image.bbox
-
-            img = imread(str(filename))
-            if img.shape[-1] == 4:
-                img = rgba2rgb(img)
-            elif len(img.shape) == 2 or img.shape[-1] == 1:
-                img = gray2rgb(img)
-
-            assert img.shape[-1] == 3, f'image must have 3 channels but got shape {img.shape}'
-
-            min_row, min_col, max_row, max_col = bbox
-            cropped = img[min_row:max_row, min_col:max_col]
-            scaled = rescale(
-                cropped,
-                get_scaling_factor(bbox, final_size=FINAL_SIZE, padding=PADDING),
-                multichannel=True,
-                anti_aliasing=True,
-                # channel_axis=-1,  # 0.19+
-            )
-            res_img = extent_gravity_center(
-                scaled,
-                width=FINAL_SIZE[0],
-                height=FINAL_SIZE[1],
-            )
-            res_img.save(filename=filename)
+class DataSourceError(Exception):
+    """Failure of a data source that carries the log collected until then."""
+
+    def __init__(self, name: str, log: str):
+        # Both are arguments, so the error can be pickled by worker processes.
+        super().__init__(name, log)
+        self.name = name
+        self.log = log
+
+    def __str__(self):
+        return f'data source {self.name} failed (see its log above)'
+
+
+def post_process_data_source(data_source: DataSource) -> Tuple[DataSource, str]:
+    """Runs the post processors of a data source in a worker process.
+    Returns the processed copy of the data source and its log.
+    """
+    with capture_output() as log:
+        try:
+            data_source.post_process()
+        except Exception as error:
+            raise DataSourceError(data_source.__class__.__name__, log.getvalue()) from error
+    return data_source, log.getvalue()
+
+
+def run_data_source(
+    data_source: DataSource,
+    processes: ProcessPoolExecutor,
+    reverify: bool = False,
+) -> Tuple[DataSource, str]:
+    name = data_source.__class__.__name__
+    with capture_output() as log:
+        try:
+            print(f'processing data source {name}')
+            if data_source.load_state(reverify):
+                print('files of previous run are up to date, skipping')
+                return data_source, log.getvalue()
+            data_source.prepare(force=False, reverify=reverify)
+        except Exception as error:
+            raise DataSourceError(name, log.getvalue()) from error
+    try:
+        data_source, post_process_log = processes.submit(post_process_data_source, data_source).result()
+    except DataSourceError as error:
+        raise DataSourceError(name, log.getvalue() + error.log) from error
+    data_source.save_state()
+    return data_source, log.getvalue() + post_process_log
 
 
-def copy_images_to_data_repo(data_sources: List[DataSource]) -> None:
+def run_data_sources(
+    data_sources: List[DataSource],
+    workers: Optional[int] = None,
+    reverify: bool = False,
+) -> List[DataSource]:
+    """Runs the data sources concurrently unless `workers` is 1.
+    The I/O bound steps run in threads and the post processors run in processes.
+    Because the post processors run on copies of the data sources,
+    the processed data sources are returned.
+    Logs are collected per data source and printed in order once a data source is done
+    (or has failed).
+    Archives are only hashed again if they have changed since their last verification
+    or if `reverify` is set.
+    The CPUs are split between the concurrent post processors,
+    so their own process pools (see `DataSource.workers`) do not oversubscribe them.
+    """
+
+    total_workers = workers or os.cpu_count() or 1
+    concurrent_data_sources = min(total_workers, len(data_sources))
     for data_source in data_sources:
-        print(f'copying images of {data_source.__class__.__name__}')
-        # for filename in tqdm(sorted(data_source.get_files())):
-        for poke_image in sorted(data_source.images):
-            dest_dir = DATA_REPO_DIR / str(poke_image.form.ndex)
-            dest_dir.mkdir(parents=True, exist_ok=True)
-            # TODO: CHECK: fix dashes, i.e. 1/emerald-animated---28.png
-            shutil.copyfile(poke_image.source_file, dest_dir / poke_image.filename)
+        data_source.workers = max(1, total_workers // concurrent_data_sources)
+
+    if workers == 1:
+        for data_source in data_sources:
+            print(f'processing data source {data_source.__class__.__name__}')
+            data_source.run(force=False, reverify=reverify)
+        return data_sources
+
+    with ThreadPoolExecutor(max_workers=workers) as threads, \
+            ProcessPoolExecutor(max_workers=concurrent_data_sources) as processes:
+        futures = [
+            threads.submit(run_data_source, data_source, processes, reverify)
+            for data_source in data_sources
+        ]
+        processed_data_sources = []
+        for future in futures:
+            try:
+                data_source, log = future.result()
+            except DataSourceError as error:
+                print(error.log, end='')
+                raise
+            print(log, end='')
+            processed_data_sources.append(data_source)
+    return processed_data_sources
+
+
+def normalize_images(
+    files: List[Tuple[Path, Path, str, Optional[BBox]]],
+    cache: Optional[ContentCache] = None,
+    integer_scaling: bool = False,
+) -> List[Optional[BBox]]:
+    """Crops the images to their bounding boxes, scales them to `FINAL_SIZE` and
+    writes them to their destinations.
+    `files` are tuples of source file, destination, digest of the source file
+    and its bounding box if known.
+    The original files are not changed, so the data sources' files stay up to date.
+    Only depends on the given files so it can run in a worker process.
+    Returns the bounding box of each original file
+    or `None` if the result was taken from the cache.
+    """
+    uncached = [
+        (src, dest, digest, bbox)
+        for src, dest, digest, bbox in files
+        if cache is None or not cache.restore(digest, dest)
+    ]
+    bboxes = dict(zip(
+        (digest for _, _, digest, _ in uncached),
+        normalize_files(
+            [src for src, _, _, _ in uncached],
+            final_size=FINAL_SIZE,
+            padding=PADDING,
+            integer_scaling=integer_scaling,
+            dests=[dest for _, dest, _, _ in uncached],
+            bboxes=[bbox for _, _, _, bbox in uncached],
+        ),
+    ))
+    if cache is not None:
+        for _, dest, digest, _ in uncached:
+            cache.store(digest, dest)
+    return [bboxes.get(digest) for _, _, digest, _ in files]
+
+
+def normalize_image_sizes(
+    data_sources: List[DataSource],
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+    cache: Optional[ContentCache] = None,
+    bbox_index: Optional[BBoxIndex] = None,
+    integer_scaling: bool = False,
+) -> None:
+    """Normalizes all images of the data sources into the `DATA_REPO_DIR` (see `get_data_repo_path`).
+    If `workers` is not 1, the images are distributed in chunks of `chunksize` over
+    a process pool (defaults to 1 process per CPU).
+    Images of a chunk are scaled together if they have the same shape,
+    which does not change the result, so the output depends on neither
+    the number of workers nor the chunk size.
+    Images whose normalized version is in the `cache` are not processed again.
+    Bounding boxes of original images are taken from the `bbox_index` if possible,
+    the bounding boxes of all other processed images are added to it.
+    See `pokemon_image_dataset.normalize.scale` for `integer_scaling`.
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    normalize = partial(normalize_images, cache=cache, integer_scaling=integer_scaling)
+    dests = set()
+    cache_hits = 0
+    cache_misses = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for data_source in data_sources:
+            print(f'normalizing image sizes for {data_source.__class__.__name__}')
+            files = []
+            for poke_image in sort_images(data_source.images):
+                dest = DATA_REPO_DIR / get_data_repo_path(poke_image)
+                assert dest not in dests, f'{dest} would be written twice, see `exclude_data_repo_collisions`'
+                dests.add(dest)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                # TODO: CHECK: fix dashes, i.e. 1/emerald-animated---28.png
+                digest = sha256sum(poke_image.source_file)
+                bbox = bbox_index.bboxes.get(digest) if bbox_index is not None else None
+                files.append((poke_image.source_file, dest, digest, bbox))
+            chunks = [
+                files[i:i + chunksize]
+                for i in range(0, len(files), chunksize)
+            ]
+            if executor is None:
+                results = map(normalize, chunks)
+            else:
+                results = executor.map(normalize, chunks)
+            for chunk, chunk_results in zip(chunks, tqdm(results, total=len(chunks))):
+                for (_, _, digest, _), bbox in zip(chunk, chunk_results):
+                    if bbox is None:
+                        cache_hits += 1
+                    else:
+                        cache_misses += 1
+                        if bbox_index is not None:
+                            bbox_index.add(digest, bbox)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if bbox_index is not None:
+        bbox_index.save()
+    if cache is not None:
+        print(f'normalization cache: {cache_hits} hits, {cache_misses} misses')
+
+
+def exclude_data_repo_collisions(data_sources: List[DataSource]) -> None:
+    """Images with the same path in the data repo (see `get_data_repo_path`)
+    would overwrite each other, e.g. if a data source maps multiple files to the same form.
+    Only the first of them (in the order of `get_final_images`) is kept for this run.
+    """
+    kept: Dict[str, PokemonImage] = {}
+    collisions = []
+    for image in get_final_images(data_sources):
+        path = get_data_repo_path(image)
+        if path in kept:
+            print(f'excluding {image.source_file} because {kept[path].source_file} is written to {path}')
+            collisions.append(image)
+        else:
+            kept[path] = image
+    exclude_images(data_sources, collisions)
+
+
+def get_final_images(data_sources: List[DataSource]) -> List[PokemonImage]:
+    """All images in the order of `normalize_image_sizes`."""
+    return [
+        image
+        for data_source in data_sources
+        for image in sort_images(data_source.images)
+    ]
+
+
+def export_packed_images(data_sources: List[DataSource], dest: Path) -> None:
+    images = get_final_images(data_sources)
+    print(f'packing {len(images)} images into {dest}')
+    export_packed(images, DATA_REPO_DIR, dest, final_size=FINAL_SIZE)
+
+
+def export_image_shards(data_sources: List[DataSource], dest: Path) -> None:
+    images = get_final_images(data_sources)
+    print(f'writing {len(images)} images to shards in {dest}')
+    export_shards(images, DATA_REPO_DIR, dest)
 
 
 def generate_stats(data_sources: List[SpriteSetDataSource]) -> None:
@@ -176,6 +318,72 @@ def generate_stats(data_sources: List[SpriteSetDataSource]) -> None:
 
 ###############################################################################
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the pokemon image dataset.')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help=(
+            'number of parallel workers for running data sources and normalizing images, '
+            '1 disables parallelism (default: number of CPUs)'
+        ),
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='normalize all images even if their normalized version is cached',
+    )
+    parser.add_argument(
+        '--integer-scaling',
+        action='store_true',
+        help='upscale images by integer factors only, which keeps pixel art sharp',
+    )
+    parser.add_argument(
+        '--reverify',
+        action='store_true',
+        help='verify the checksums of all archives even if they have been verified before',
+    )
+    parser.add_argument(
+        '--duplicates',
+        choices=DUPLICATE_POLICIES,
+        default='remove',
+        help=(
+            'what to do with images of the same pokemon with equal pixels: '
+            'leave them out, write them to the data repo as hard links to the kept images '
+            'or only report them (default: remove)'
+        ),
+    )
+    parser.add_argument(
+        '--near-duplicate-threshold',
+        type=int,
+        default=NEAR_DUPLICATE_THRESHOLD,
+        help=(
+            'leave out animation frames whose perceptual hash differs in at most this many bits '
+            'from another frame of the same animation, a negative value keeps all frames '
+            f'(default: {NEAR_DUPLICATE_THRESHOLD})'
+        ),
+    )
+    parser.add_argument(
+        '--packed',
+        type=Path,
+        default=None,
+        help=(
+            'also export all images as 1 memory-mappable array with a metadata index to this folder, '
+            'see `PokemonImageDataset(packed=True)`'
+        ),
+    )
+    parser.add_argument(
+        '--shards',
+        type=Path,
+        default=None,
+        help=(
+            'also export all images as tar archives of a fixed number of images to this folder, '
+            'see `StreamingPokemonImageDataset`'
+        ),
+    )
+    args = parser.parse_args()
+
+    BasePokemonImage.bbox_index = BBoxIndex(BBOX_INDEX_FILE)
     data_sources: List[SpriteSetDataSource] = [
         DataSource(tmp_dir=TMP_DIR)
         for DataSource in (
@@ -191,16 +399,48 @@ if __name__ == '__main__':
         )
     ]
     print('\nRUNNING DATA SOURCES')
-    run_data_sources(data_sources)
+    data_sources = run_data_sources(data_sources, workers=args.workers, reverify=args.reverify)
 
-    print('\nREMOVING DUPLICATES')
-    remove_adjacent_duplicates(data_sources)
+    print('\nEXCLUDING IMAGES WITH EQUAL NAMES')
+    exclude_data_repo_collisions(data_sources)
+
+    print('\nFINDING DUPLICATES')
+    duplicates = remove_duplicates(data_sources, policy=args.duplicates, workers=args.workers)
+
+    if args.near_duplicate_threshold >= 0:
+        print('\nREMOVING NEAR-DUPLICATE FRAMES')
+        remove_near_duplicate_frames(
+            data_sources,
+            threshold=args.near_duplicate_threshold,
+            workers=args.workers,
+        )
 
     print('\nNORMALIZING IMAGES')
-    normalize_image_sizes(data_sources)
+    normalize_image_sizes(
+        data_sources,
+        workers=args.workers,
+        cache=None if args.no_cache else ContentCache(
+            NORMALIZATION_CACHE_DIR,
+            final_size=FINAL_SIZE,
+            padding=PADDING,
+            integer_scaling=args.integer_scaling,
+            version=NORMALIZATION_VERSION,
+        ),
+        bbox_index=BasePokemonImage.bbox_index,
+        integer_scaling=args.integer_scaling,
+    )
+
+    if args.duplicates == 'link':
+        print('\nLINKING DUPLICATES')
+        link_duplicates(data_sources, duplicates, DATA_REPO_DIR)
+
+    if args.packed is not None:
+        print('\nEXPORTING PACKED IMAGES')
+        export_packed_images(data_sources, args.packed)
 
-    print('\nMOVING IMAGES TO DATA REPO')
-    copy_images_to_data_repo(data_sources)
+    if args.shards is not None:
+        print('\nEXPORTING SHARDS')
+        export_image_shards(data_sources, args.shards)
 
     print('\nGENERATING STATS')
     generate_stats(data_sources)
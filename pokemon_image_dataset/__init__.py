@@ -1 +1,10 @@
-from .dataset import PokemonImageDataset
+def __getattr__(name):
+    # The dataset depends on torchvision, which is slow to import
+    # and not needed for creating the dataset.
+    if name in __all__:
+        from . import dataset
+        return getattr(dataset, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+__all__ = ['PokemonImageDataset', 'StreamingPokemonImageDataset']
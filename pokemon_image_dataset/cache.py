@@ -0,0 +1,98 @@
+"""Persistent caches that allow skipping work for inputs that did not change."""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+from pokemon_image_dataset.utils import BBox, get_file_bboxes, sha256sum
+
+
+class ContentCache:
+    """Content addressed store for the results of a deterministic file transformation.
+
+    Entries are keyed by the SHA-256 of the source file and the parameters
+    of the transformation (which should include a code version).
+    """
+
+    def __init__(self, root: Path, suffix: str = '.png', **params: Any):
+        self.root = root
+        self.suffix = suffix
+        self.params = json.dumps(params, sort_keys=True)
+
+    def key(self, digest: str) -> str:
+        return hashlib.sha256(f'{digest}:{self.params}'.encode()).hexdigest()
+
+    def get_path(self, digest: str) -> Path:
+        key = self.key(digest)
+        return self.root / key[:2] / f'{key}{self.suffix}'
+
+    def restore(self, digest: str, dest: Path) -> bool:
+        """Writes the cached result for the source file with the given digest to `dest`.
+        Returns whether there was a cached result.
+        """
+        cached = self.get_path(digest)
+        if not cached.exists():
+            return False
+        # Replace the file instead of writing to it, so files hard linked to it
+        # by a previous run (see `pokemon_image_dataset.dedup.link_duplicates`) are not changed.
+        tmp = dest.with_name(f'.{dest.name}.{os.getpid()}')
+        shutil.copyfile(cached, tmp)
+        os.replace(tmp, dest)
+        return True
+
+    def store(self, digest: str, result: Path) -> None:
+        """Stores the file `result` as the result for the source file with the given digest."""
+        cached = self.get_path(digest)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see partial files.
+        tmp = cached.with_name(f'.{cached.name}.{os.getpid()}')
+        shutil.copyfile(result, tmp)
+        os.replace(tmp, cached)
+
+
+class BBoxIndex:
+    """Persistent bounding boxes of image files keyed by the SHA-256 of their content.
+    Bounding boxes are only computed for files that are not in the index yet.
+    Call `save` to persist newly added bounding boxes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.bboxes: Dict[str, BBox] = {}
+        if path.exists():
+            with open(path) as file:
+                self.bboxes = {
+                    digest: tuple(bbox)
+                    for digest, bbox in json.load(file).items()
+                }
+
+    def __len__(self) -> int:
+        return len(self.bboxes)
+
+    def add(self, digest: str, bbox: BBox) -> None:
+        self.bboxes[digest] = tuple(bbox)
+
+    def get(self, filename: Path) -> BBox:
+        return self.get_many([filename])[0]
+
+    def get_many(self, filenames: Sequence[Path]) -> List[BBox]:
+        digests = [sha256sum(filename) for filename in filenames]
+        missing = {
+            digest: filename
+            for digest, filename in zip(digests, filenames)
+            if digest not in self.bboxes
+        }
+        if missing:
+            for digest, bbox in zip(missing, get_file_bboxes(list(missing.values()))):
+                self.add(digest, bbox)
+        return [self.bboxes[digest] for digest in digests]
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f'.{self.path.name}.{os.getpid()}')
+        with open(tmp, 'w') as file:
+            json.dump(self.bboxes, file)
+        os.replace(tmp, self.path)
@@ -3,7 +3,6 @@ from abc import ABC
 from pathlib import Path
 from typing import Generic
 
-from pokemon_image_dataset.utils import download
 from .base import DataSource, T
 
 
@@ -19,5 +18,8 @@ class RemoteArchiveDataSource(ArchiveDataSource, ABC, Generic[T]):
     def get(self, force):
         download_dest = self.tmp_dir / Path(self.url).name
         if not download_dest.exists() or force:
-            download(self.url, download_dest)
+            from pokemon_image_dataset.downloader import download
+
+            download(self.url, download_dest, checksum=self.checksum)
+            self.verified_paths.add(download_dest)
         return download_dest
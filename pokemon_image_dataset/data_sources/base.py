@@ -1,9 +1,11 @@
+import hashlib
+import json
 from abc import ABC, abstractmethod
 from collections import Iterable, Collection, Callable
 from pathlib import Path
-from typing import TypeVar, Generic, Union
+from typing import Generic, Optional, TypeVar, Union
 
-from pokemon_image_dataset.form import POKEMON_FORMS, DISMISS_FORM, PokemonForm, BasePokemonImage
+from pokemon_image_dataset.form import FORM_REGISTRY, DISMISS_FORM, PokemonForm, BasePokemonImage, sort_images
 from pokemon_image_dataset.utils import (
     parse_ndex,
     verify_sha256_checksum,
@@ -23,29 +25,106 @@ class DataSource(ABC, Generic[T]):
     extra_ops = ()
     tmp_dir: Path = None
     images: set[T] = []
+    image_class: type[T] = None
+    """Used for restoring the images of a previous run."""
+    workers: Optional[int] = None
+    """Number of processes used by post processors (defaults to 1 per CPU), 1 disables parallelism."""
 
     def __init__(self, *, tmp_dir: Path):
         self.tmp_dir = tmp_dir
-
-    def run(self, force=False) -> None:
+        self.verified_paths: set[Path] = set()
+        """Files whose checksum has already been verified, e.g. while downloading them."""
+
+    def run(self, force=False, reverify=False) -> None:
+        if not force and self.load_state(reverify):
+            print('files of previous run are up to date, skipping')
+            return
+        self.prepare(force, reverify)
+        self.post_process()
+        self.save_state()
+
+    def prepare(self, force=False, reverify=False) -> None:
+        """Runs all steps up to (excluding) the post processing.
+        These steps are mostly I/O bound, post processing is mostly CPU bound.
+        """
+        # The files are going to change, so the state of a previous run is invalid from now on.
+        self.state_file.unlink(missing_ok=True)
         self.root.mkdir(parents=True, exist_ok=True)
         data_path = self.get(force)
-        self.verify_checksum(data_path)
+        self.verify_checksum(data_path, reverify)
         self.process(data_path)
         self.arrange()
         self.images = set(self.get_images(self.associate_forms()))
-        self.post_process()
 
     @property
     def root(self) -> Path:
         return self.tmp_dir / f'__{self.__class__.__name__}'
 
+    @property
+    def state_file(self) -> Path:
+        return self.tmp_dir / f'__{self.__class__.__name__}.json'
+
+    def get_fingerprint(self) -> str:
+        """Changes whenever the archive or the configuration of the data source changes."""
+        data = repr(self.get_fingerprint_data()).replace(repr(DISMISS_FORM), 'DISMISS_FORM')
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get_fingerprint_data(self) -> tuple:
+        return self.checksum, list(self.assign_forms().items())
+
+    def save_state(self) -> None:
+        """Saves the fingerprint, files and images of a completed run."""
+        state = {
+            'fingerprint': self.get_fingerprint(),
+            'files': self.get_relative_files(),
+            'images': [image.to_dict(root=self.tmp_dir) for image in sort_images(self.images)],
+        }
+        with open(self.state_file, 'w') as file:
+            json.dump(state, file)
+
+    def load_state(self, reverify: bool = False) -> bool:
+        """Restores the images of the previous run if neither the fingerprint
+        nor the files on disk have changed since then.
+        With `reverify`, the archive is verified before (see `verify_checksum`),
+        because it is not verified again when the state is restored.
+        Returns whether the state was restored.
+        """
+        if self.image_class is None or not self.state_file.exists():
+            return False
+
+        with open(self.state_file) as file:
+            state = json.load(file)
+        if state['fingerprint'] != self.get_fingerprint():
+            return False
+        try:
+            if state['files'] != self.get_relative_files():
+                return False
+        except FileNotFoundError:
+            return False
+
+        if reverify:
+            print('verifying archive of previous run')
+            self.verify_checksum(self.get(force=False), reverify=True)
+        self.images = {
+            self.image_class.from_dict(data, data_source=self, root=self.tmp_dir)
+            for data in state['images']
+        }
+        return True
+
+    def get_relative_files(self) -> list[str]:
+        return sorted(str(filename.relative_to(self.tmp_dir)) for filename in self.get_files())
+
     @abstractmethod
     def get(self, force: bool):
         ...
 
-    def verify_checksum(self, data_path: Path) -> None:
-        verify_sha256_checksum(data_path, self.checksum)
+    def verify_checksum(self, data_path: Path, reverify=False) -> None:
+        """Unless `reverify` is set, archives that have been verified before
+        (and have not changed since) are not hashed again.
+        """
+        if data_path not in self.verified_paths:
+            verify_sha256_checksum(data_path, self.checksum, reverify=reverify)
+            self.verified_paths.add(data_path)
 
     def process(self, archive) -> None:
         ...
@@ -69,7 +148,7 @@ class DataSource(ABC, Generic[T]):
                 found_form: PokemonForm
                 if form is None:
                     ndex = self.parse_ndex(stem)
-                    forms = [f for f in POKEMON_FORMS[ndex] if f.name == stem]
+                    forms = FORM_REGISTRY.find_by_name(ndex, stem)
                     assert len(forms) == 1, (
                         f'got {len(forms)} matching forms instead 1 for {filename}'
                     )
@@ -1,11 +1,40 @@
 import shutil
+from pathlib import Path
 
-from py7zr import unpack_7zarchive
-from wand.image import Image
+import numpy as np
 
 from pokemon_image_dataset.data_sources import SpriteSetDataSource, SpriteSetConfig, PathDict
-from pokemon_image_dataset.form import DISMISS_FORM, Form, get_form
-from pokemon_image_dataset.utils import FORM_NAME_DELIMITER, name
+from pokemon_image_dataset.form import DISMISS_FORM, Form, PokemonImage, get_form, sort_images
+from pokemon_image_dataset.utils import FORM_NAME_DELIMITER, name, process_map
+
+
+def get_strip_frame_filename(filename: Path, frame: int) -> Path:
+    return filename.with_stem(name(filename.stem, str(frame)))
+
+
+def split_strip(filename: Path) -> list[int]:
+    """Saves the square frames of a horizontal sprite strip as separate files
+    (see `get_strip_frame_filename`) and deletes the strip.
+    Frames that are equal to a previous frame are skipped.
+    Returns the indices of the saved frames.
+    """
+    from skimage.io import imread, imsave
+
+    img = imread(str(filename))
+    if img.ndim == 2:
+        img = img[..., np.newaxis]
+    height, width, channels = img.shape
+    assert (width / height).is_integer(), 'invalid/non-integer image ratio'
+    num_frames = width // height
+    # View of shape (frame, y, x, channel) without copying.
+    frames = img.reshape(height, num_frames, height, channels).transpose(1, 0, 2, 3)
+    _, first_indices = np.unique(frames.reshape(num_frames, -1), axis=0, return_index=True)
+    saved = sorted(int(i) for i in first_indices)
+    for i in saved:
+        frame = frames[i] if channels > 1 else frames[i, ..., 0]
+        imsave(str(get_strip_frame_filename(filename, i)), frame, check_contrast=False)
+    filename.unlink()
+    return saved
 
 
 class BattlersDataSource(SpriteSetDataSource):
@@ -28,6 +57,8 @@ class BattlersDataSource(SpriteSetDataSource):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        from py7zr import unpack_7zarchive
+
         try:
             shutil.register_unpack_format('7zip', ['.7z'], unpack_7zarchive)
         except shutil.RegistryError as error:
@@ -47,24 +78,31 @@ class BattlersDataSource(SpriteSetDataSource):
     def parse_ndex(self, filename: str) -> int:
         return super().parse_ndex(filename.replace('_', FORM_NAME_DELIMITER))
 
-    # TODO: use image.split
     def extract_frames(self, src: str, conf: SpriteSetConfig) -> None:
+        """Replaces the sprite strips by their frames.
+        The strips are split in parallel.
+        """
         # This data source only contains 1 sprite set, thus we can just iterate all images.
-        for poke_image in self.images:
-            filename = poke_image.source_file
-            print('extract_frames', filename)
-            with Image(filename=filename) as img:
-                assert (img.width / img.height).is_integer(), 'invalid/non-integer image ratio'
-                frame_width, frame_height = img.height, img.height
-
-                for x in range(0, img.width, frame_width):
-                    i = x // frame_width
-                    frame = img[x:x+frame_width, 0:frame_height]
-                    frame.format = 'png'
-                    frame.save(
-                        filename=filename.with_stem(name(filename.stem, str(i))),
-                    )
-                filename.unlink()
+        strips = sort_images(self.images)
+        results = process_map(
+            split_strip,
+            [image.source_file for image in strips],
+            workers=self.workers,
+        )
+        self.images = set()
+        for image, frames in zip(strips, results):
+            print('extracted frames', frames, 'from', image.source_file)
+            self.images.update(
+                PokemonImage(
+                    data_source_name=image.data_source_name,
+                    form=image.form,
+                    source_file=get_strip_frame_filename(image.source_file, i),
+                    sprite_set=image.sprite_set,
+                    frame=i,
+                    format=image.format,
+                )
+                for i in frames
+            )
 
     def assign_forms(self):
         return PathDict.with_prefix(
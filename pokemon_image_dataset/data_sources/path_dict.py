@@ -1,14 +1,26 @@
-from pathlib import Path
+import re
+from fnmatch import translate
+from pathlib import Path, PurePath
 from typing import Dict, Optional, TypeVar, Generic
 
 T = TypeVar('T')
 
+GLOB_CHARS = re.compile(r'[*?\[]')
+
 
 class PathDict(Generic[T], dict):
     """Keys are strings representing paths.
     Item access happens with `Path` instances.
+    The value of the first key that matches the path (with or without suffix)
+    according to `Path.match` is returned.
+
+    Lookups use an index that is compiled on first access:
+    Keys without glob characters are looked up by their parts in a hash table
+    and glob keys with the same number of parts are combined into a single regex.
     """
 
+    _index = None
+
     @classmethod
     def with_prefix(cls, prefix: str, kwargs: Dict[str, T]):
         return cls({
@@ -19,7 +31,81 @@ class PathDict(Generic[T], dict):
     def __getitem__(self, path: Path) -> Optional[T]:
         # assert isinstance(
         #     path, Path), f'expected key to be a Path but got {type(path).__name__}'
-        for key, val in self.items():
-            if path.match(key) or path.with_suffix('').match(key):
-                return val
-        return None
+        if self._index is None:
+            self._index = self._compile()
+        values, exact, globs, other = self._index
+
+        first = len(values)
+        for candidate in {path, path.with_suffix('')}:
+            parts = candidate.parts
+            for num_parts, indices in exact.items():
+                if num_parts <= len(parts):
+                    first = min(first, indices.get(parts[-num_parts:], first))
+            for num_parts, regex in globs.items():
+                if num_parts <= len(parts):
+                    match = regex.fullmatch('/'.join(parts[-num_parts:]))
+                    if match:
+                        first = min(first, int(match.lastgroup[1:]))
+            for i, key in other:
+                if i < first and candidate.match(key):
+                    first = i
+        return values[first] if first < len(values) else None
+
+    def _compile(self) -> tuple:
+        values = list(self.values())
+        exact: dict[int, dict[tuple[str, ...], int]] = {}
+        glob_patterns: dict[int, list[str]] = {}
+        # Absolute keys are matched as a whole, so they are not indexed.
+        other: list[tuple[int, str]] = []
+        for i, key in enumerate(self.keys()):
+            key_path = PurePath(key)
+            parts = key_path.parts
+            if key_path.anchor:
+                other.append((i, key))
+            elif GLOB_CHARS.search(key):
+                # Each part is matched separately by `Path.match`.
+                # As the candidate has as many slashes as the pattern,
+                # wildcards cannot match slashes here.
+                pattern = '/'.join(
+                    re.sub(r'\\Z$', '', translate(part))
+                    for part in parts
+                )
+                glob_patterns.setdefault(len(parts), []).append(f'(?P<k{i}>{pattern})')
+            else:
+                exact.setdefault(len(parts), {}).setdefault(parts, i)
+        globs = {
+            num_parts: re.compile('|'.join(patterns))
+            for num_parts, patterns in glob_patterns.items()
+        }
+        return values, exact, globs, other
+
+    def _invalidate(self) -> None:
+        self._index = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate()
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def pop(self, *args):
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._invalidate()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._invalidate()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._invalidate()
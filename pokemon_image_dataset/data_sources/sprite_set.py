@@ -1,15 +1,37 @@
+import os
 import shutil
+import tarfile
 from dataclasses import dataclass, field
-from pathlib import Path
+from fnmatch import fnmatchcase
+from pathlib import Path, PurePosixPath
 from typing import Collection, Optional, Union
 
-from pokemon_image_dataset.form import PokemonForm, PokemonImage
-from pokemon_image_dataset.utils import NAME_DELIMITER, get_image_frames, whiten_areas
+from pokemon_image_dataset.form import PokemonForm, PokemonImage, sort_images
+from pokemon_image_dataset.utils import NAME_DELIMITER, get_image_frames, process_map, whiten_areas
 from .archive import RemoteArchiveDataSource
 
 PostProcessorSpec = Union[str, tuple[str, dict]]
 
 
+def get_frame_filename(filename: Path, frame: int) -> Path:
+    return filename.with_stem(f'{filename.stem}{NAME_DELIMITER}{frame}').with_suffix('.png')
+
+
+def split_gif(gif: Path) -> tuple[list[int], list[int]]:
+    """Saves the frames of the gif as pngs (see `get_frame_filename`).
+    Returns the indices of the saved frames and of the excluded single color frames.
+    """
+    saved = []
+    excluded = []
+    for i, frame in enumerate(get_image_frames(gif)):
+        if frame.getcolors(maxcolors=1) is not None:
+            excluded.append(i)
+        else:
+            frame.save(get_frame_filename(gif, i))
+            saved.append(i)
+    return saved, excluded
+
+
 @dataclass
 class SpriteSetConfig:
     glob: str
@@ -28,12 +50,74 @@ class SpriteSetConfig:
 class SpriteSetDataSource(RemoteArchiveDataSource[PokemonImage]):
     sprite_sets: dict[str, SpriteSetConfig] = {}
     """Keys are folders in the (unpacked) data source."""
+    image_class = PokemonImage
+    stream_archive = True
+    """Extract only the files of the sprite sets, directly to their destinations (tar archives only)."""
+    streamed = False
+
+    def get_fingerprint_data(self) -> tuple:
+        return *super().get_fingerprint_data(), self.sprite_sets
+
+    def process(self, archive):
+        self.streamed = self.stream_archive and tarfile.is_tarfile(archive)
+        if self.streamed:
+            self.extract_sprite_sets(archive)
+        else:
+            super().process(archive)
+
+    def extract_sprite_sets(self, archive: Path) -> None:
+        """Reads the archive once and writes the files matching the sprite sets
+        to the same destinations that `arrange` would move them to.
+        All other files are skipped.
+        """
+
+        globs_by_folder: dict[PurePosixPath, list[tuple[str, Path]]] = {}
+        extras: dict[PurePosixPath, Path] = {}
+        for src, conf in self.sprite_sets.items():
+            dest = self.get_dest(src)
+            if dest.exists():
+                print('deleting existing', dest)
+                shutil.rmtree(dest)
+            dest.mkdir(parents=True, exist_ok=True)
+            globs_by_folder.setdefault(PurePosixPath(src), []).append((conf.glob, dest))
+            for extra_src, extra_dest in conf.extra.items():
+                extras[PurePosixPath(src, extra_src)] = dest / extra_dest
+
+        with tarfile.open(archive) as tar:
+            for member in tar:
+                if not (member.isfile() or member.islnk() or member.issym()):
+                    continue
+                # Normalizes e.g. './pokemon/...'.
+                path = PurePosixPath(os.path.normpath(member.name))
+                target = extras.get(path)
+                if target is None:
+                    target = next(
+                        (
+                            dest / path.name
+                            for pattern, dest in globs_by_folder.get(path.parent, ())
+                            if fnmatchcase(path.name, pattern)
+                        ),
+                        None,
+                    )
+                if target is None:
+                    continue
+
+                if member.issym():
+                    os.symlink(member.linkname, target)
+                else:
+                    with tar.extractfile(member) as src_file, open(target, 'wb') as dest_file:
+                        shutil.copyfileobj(src_file, dest_file)
 
     def arrange(self):
         """Moves sprite set folders into `self.tmp_dir` and
         saves the destinations for `self.get_files`.
         """
 
+        if self.streamed:
+            # Already extracted to the destinations.
+            shutil.rmtree(self.root)
+            return
+
         for src, conf in self.sprite_sets.items():
             root = self.root / src
             pattern = conf.glob
@@ -53,7 +137,7 @@ class SpriteSetDataSource(RemoteArchiveDataSource[PokemonImage]):
     def get_images(self, associated_forms: list[tuple[PokemonForm, Path]]) -> list[PokemonImage]:
         return [
             PokemonImage(
-                data_source=self,
+                data_source_name=self.__class__.__name__,
                 form=form,
                 source_file=filename,
                 sprite_set=filename.parent.name,
@@ -87,37 +171,40 @@ class SpriteSetDataSource(RemoteArchiveDataSource[PokemonImage]):
 
     # POST PROCESSORS
     def split_gif_frames(self, src: str, conf: SpriteSetConfig):
-        def split_image(image: PokemonImage) -> list[PokemonImage]:
-            gif = image.source_file
-            assert gif.suffix == '.gif', f'expected gif image but got {image.source_file}'
-            images = []
-            for i, frame in enumerate(get_image_frames(gif)):
-                # Ignore single color frames
-                if frame.colors == 1:
-                    print(f'excluding single color frame {i} from {gif}')
-                    continue
-
-                frame_png = gif.with_stem(f'{gif.stem}{NAME_DELIMITER}{i}').with_suffix('.png')
-                frame.save(filename=frame_png)
-                images.append(PokemonImage(
-                    data_source=image.data_source,
+        """Replaces the gifs of the sprite set by their frames.
+        The gifs are split in parallel.
+        """
+        sprite_set = self.get_dest(src).name
+        images_to_replace = sort_images(
+            image
+            for image in self.images
+            if image.sprite_set == sprite_set
+        )
+        for image in images_to_replace:
+            assert image.source_file.suffix == '.gif', f'expected gif image but got {image.source_file}'
+
+        replacements = set()
+        results = process_map(
+            split_gif,
+            [image.source_file for image in images_to_replace],
+            workers=self.workers,
+        )
+        for image, (saved, excluded) in zip(images_to_replace, results):
+            for i in excluded:
+                print(f'excluding single color frame {i} from {image.source_file}')
+            replacements.update(
+                PokemonImage(
+                    data_source_name=image.data_source_name,
                     form=image.form,
-                    source_file=frame_png,
+                    source_file=get_frame_filename(image.source_file, i),
                     sprite_set=image.sprite_set,
                     frame=i,
                     format='.png',
-                ))
-            return images
-
-        # TODO: async
-        images_to_replace = {image for image in self.images if image.sprite_set == src}
-        replacements = {
-            replacement
-            for image in images_to_replace
-            for replacement in split_image(image)
-        }
+                )
+                for i in saved
+            )
         assert all(img.source_file.exists() for img in replacements), "some of the split images' files do not exist"
-        self.images = (self.images - images_to_replace) | replacements
+        self.images = (self.images - set(images_to_replace)) | replacements
 
     def whiten_areas(
         self,
@@ -130,7 +217,8 @@ class SpriteSetDataSource(RemoteArchiveDataSource[PokemonImage]):
             for form in forms
         ]
         dest = self.get_dest(src)
-        for form, coords in forms_an_coords:
-            filename = dest / f'{form.name}.png'
+        filenames = [dest / f'{form.name}.png' for form, _ in forms_an_coords]
+        all_coords = [coords for _, coords in forms_an_coords]
+        for filename, coords in zip(filenames, all_coords):
             print('whitening area of', filename, 'at', coords)
-            whiten_areas(filename, coords)
+        process_map(whiten_areas, filenames, all_coords, workers=self.workers)
@@ -1,9 +1,37 @@
-from cairosvg import svg2png
+from pathlib import Path
 
 from pokemon_image_dataset.data_sources import PathDict
 from pokemon_image_dataset.data_sources import SpriteSetConfig as Conf
 from pokemon_image_dataset.data_sources import SpriteSetDataSource
-from pokemon_image_dataset.form import Form, get_form
+from pokemon_image_dataset.form import Form, PokemonImage, get_form, sort_images
+from pokemon_image_dataset.normalize import FINAL_SIZE, PADDING
+from pokemon_image_dataset.utils import get_array_bbox, get_scaling_factor, process_map, read_image
+
+PROBE_SCALE = 0.25
+"""Scale of the preview that is rendered to measure the bounding box of the pokemon."""
+
+
+def rasterize_svg(svg: Path) -> Path:
+    """Renders the svg as png such that the bounding box of the pokemon
+    is at least as large as it will be after normalization to `FINAL_SIZE`.
+    The scale is derived from the bounding box of a small preview,
+    so normalization only needs to downscale slightly.
+    """
+    from cairosvg import svg2png
+
+    data = svg.read_bytes()
+    probe = svg.with_name(f'.{svg.stem}.probe.png')
+    svg2png(bytestring=data, write_to=str(probe), scale=PROBE_SCALE)
+    min_row, min_col, max_row, max_col = get_array_bbox(read_image(probe), filename=svg)
+    probe.unlink()
+    # Anti-aliasing may enlarge the preview's bounding box by up to 1 pixel on each side.
+    inner_bbox = (0, 0, max(max_row - min_row - 2, 1), max(max_col - min_col - 2, 1))
+    scale = PROBE_SCALE * get_scaling_factor(inner_bbox, FINAL_SIZE, PADDING)
+
+    png = svg.with_suffix('.png')
+    svg2png(bytestring=data, write_to=str(png), scale=scale)
+    svg.unlink()
+    return png
 
 
 class DreamWorld(SpriteSetDataSource):
@@ -20,8 +48,8 @@ class DreamWorld(SpriteSetDataSource):
         ),
     }
 
-    def run(self, force=False):
-        super().run(force)
+    def post_process(self):
+        super().post_process()
         self.svg2png()
 
     def assign_forms(self):
@@ -50,13 +78,27 @@ class DreamWorld(SpriteSetDataSource):
             'dream-world/648': get_form(648, 'aria'),
         })
 
-    # TODO: Use wand? https://stackoverflow.com/a/19718153/6928824
+    def get_fingerprint_data(self) -> tuple:
+        # The svgs are rendered at a resolution depending on the final size.
+        return *super().get_fingerprint_data(), FINAL_SIZE, PADDING
+
     def svg2png(self):
-        dest = self.tmp_dir / 'dream-world'
-        for filename in dest.iterdir():
-            with open(filename, 'rb') as file:
-                svg2png(
-                    file_obj=file,
-                    write_to=str(dest / f'{filename.stem}.png'),
-                )
-            filename.unlink()
+        """Replaces the svgs by pngs (see `rasterize_svg`).
+        The svgs are rendered in parallel.
+        """
+        svgs = sort_images(image for image in self.images if image.format == '.svg')
+        pngs = process_map(
+            rasterize_svg,
+            [image.source_file for image in svgs],
+            workers=self.workers,
+        )
+        self.images = (self.images - set(svgs)) | {
+            PokemonImage(
+                data_source_name=image.data_source_name,
+                form=image.form,
+                source_file=png,
+                sprite_set=image.sprite_set,
+                format='.png',
+            )
+            for image, png in zip(svgs, pngs)
+        }
@@ -1,12 +1,19 @@
+import io
+import json
 from pathlib import Path
+import random
 import shutil
+import tarfile
 import tempfile
-from typing import Optional
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
-from torchvision.datasets import ImageFolder
+import numpy as np
+from PIL import Image
+from torch.utils.data import IterableDataset, get_worker_info
+from torchvision.datasets import ImageFolder, VisionDataset
 
+from pokemon_image_dataset.export import PACKED_IMAGES_FILE, PACKED_INDEX_FILE, SHARDS_INDEX_FILE
 from pokemon_image_dataset.utils import (
-    download,
     replace_children_with_grandchildren,
     verify_sha256_checksum,
 )
@@ -21,6 +28,13 @@ CHECKSUM_BY_VERSION = {
 
 
 class PokemonImageDataset(ImageFolder):
+    """The folders of pngs per pokemon in `root`.
+    With `packed=True`, `root` is a folder exported with `main.py --packed` instead.
+    Its images are memory-mapped, so samples are read-only uint8 arrays of shape (H, W, 3)
+    (views into the file that are neither decoded nor copied)
+    which are passed to `transform` instead of PIL images.
+    Classes and targets are the same in both modes.
+    """
 
     NEXT_VERSION_URL = (
         'https://github.com/jneuendorf/pokemon-image-dataset-files/'
@@ -37,6 +51,7 @@ class PokemonImageDataset(ImageFolder):
             root: str,
             download: bool = False,
             version: str = 'latest',
+            packed: bool = False,
             **kwargs
     ):
         if version == 'latest':
@@ -46,22 +61,80 @@ class PokemonImageDataset(ImageFolder):
         )
         self.version = version
 
+        self.packed = packed
+        assert not (download and packed), 'only the folders of pngs can be downloaded'
+
         if download:
             self.download(Path(root))
 
-        super().__init__(*args, root=root, **kwargs)
+        if packed:
+            self.load_packed_index(root, *args, **kwargs)
+        else:
+            super().__init__(*args, root=root, **kwargs)
+
+    def load_packed_index(
+            self,
+            root: str,
+            transform: Optional[Callable] = None,
+            target_transform: Optional[Callable] = None,
+    ) -> None:
+        VisionDataset.__init__(self, root, transform=transform, target_transform=target_transform)
+        with open(Path(root) / PACKED_INDEX_FILE) as file:
+            index = json.load(file)
+        self.classes = index['classes']
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.records = index['samples']
+        self.samples = [
+            (str(Path(root) / record['path']), record['target'])
+            for record in self.records
+        ]
+        self.targets = [target for _, target in self.samples]
+        self.imgs = self.samples
+        self._packed_images: Optional[np.ndarray] = None
+
+    @property
+    def packed_images(self) -> np.ndarray:
+        """Opened on first access, i.e. once per data loader worker."""
+        if self._packed_images is None:
+            self._packed_images = np.load(Path(self.root) / PACKED_IMAGES_FILE, mmap_mode='r')
+        return self._packed_images
+
+    def __getitem__(self, index: int) -> Tuple[Any, Any]:
+        if not self.packed:
+            return super().__getitem__(index)
+
+        sample = self.packed_images[index]
+        target = self.targets[index]
+        if self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return sample, target
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Pickling the memory map would copy all images into each data loader worker.
+        if self.packed:
+            state['_packed_images'] = None
+        return state
 
     def download(self, root: Path) -> None:
+        # requests is only needed for downloading.
+        from pokemon_image_dataset.downloader import download
+
         download_dest = Path(tempfile.gettempdir()) / self.download_filename
+        downloaded = False
         if not download_dest.exists():
-            download(self.url, dest=download_dest)
+            # Verifies the checksum while downloading.
+            download(self.url, dest=download_dest, checksum=self.checksum)
+            downloaded = True
         else:
             print(f'Using cached file at {download_dest}.')
 
         # We don't want to update the checksum for each commit.
         if self.version == NEXT_VERSION:
             print('Skipping checksum verification for bleeding edge version.')
-        else:
+        elif not downloaded:
             try:
                 verify_sha256_checksum(download_dest, self.checksum)
             except ValueError:
@@ -93,3 +166,100 @@ class PokemonImageDataset(ImageFolder):
             if self.version != NEXT_VERSION
             else None
         )
+
+
+SHUFFLE_BUFFER_SIZE = 1000
+
+
+def shuffled(samples: Iterable, buffer_size: int, rng: random.Random) -> Iterator:
+    """Shuffles a stream of samples approximately
+    by yielding a random sample of a buffer whenever it is full.
+    """
+    buffer = []
+    for sample in samples:
+        buffer.append(sample)
+        if len(buffer) >= buffer_size:
+            i = rng.randrange(len(buffer))
+            buffer[i], buffer[-1] = buffer[-1], buffer[i]
+            yield buffer.pop()
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class StreamingPokemonImageDataset(IterableDataset):
+    """Streams the images of the shards exported with `main.py --shards` in `root`.
+    Each data loader worker reads a different subset of the shards sequentially
+    (in random order if shuffling), so reading is not slowed down by random access.
+    Samples are shuffled with a buffer of `shuffle_buffer_size` samples per worker,
+    0 disables shuffling.
+    Samples, classes and targets are the same as of `PokemonImageDataset`.
+    """
+
+    def __init__(
+            self,
+            root: str,
+            transform: Optional[Callable] = None,
+            target_transform: Optional[Callable] = None,
+            shuffle_buffer_size: int = SHUFFLE_BUFFER_SIZE,
+            seed: Optional[int] = None,
+    ):
+        super().__init__()
+        self.root = Path(root)
+        self.transform = transform
+        self.target_transform = target_transform
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        """Seeds the shuffling if given. Then, each epoch has the same order."""
+
+        with open(self.root / SHARDS_INDEX_FILE) as file:
+            index = json.load(file)
+        self.classes: List[str] = index['classes']
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.shards = [self.root / shard['filename'] for shard in index['shards']]
+        self.num_samples = sum(shard['size'] for shard in index['shards'])
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def get_worker_shards(self, rng: random.Random) -> List[Path]:
+        shards = list(self.shards)
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            shards = shards[worker_info.id::worker_info.num_workers]
+        if self.shuffle_buffer_size > 0:
+            rng.shuffle(shards)
+        return shards
+
+    def read_shards(self, shards: Iterable[Path]) -> Iterator[Tuple[Image.Image, dict]]:
+        """Yields the decoded images and their metadata in the order of the shards' files."""
+        for shard in shards:
+            image = None
+            # Streaming mode reads the file sequentially.
+            with tarfile.open(shard, mode='r|') as tar:
+                for member in tar:
+                    data = tar.extractfile(member).read()
+                    if member.name.endswith('.json'):
+                        assert image is not None, f'no image before {member.name} in {shard}'
+                        yield image, json.loads(data)
+                        image = None
+                    else:
+                        # Like the default loader of `ImageFolder`.
+                        image = Image.open(io.BytesIO(data)).convert('RGB')
+
+    def __iter__(self) -> Iterator[Tuple[Any, Any]]:
+        worker_info = get_worker_info()
+        if self.seed is None:
+            rng = random.Random()
+        else:
+            rng = random.Random(self.seed + (worker_info.id if worker_info is not None else 0))
+
+        samples = self.read_shards(self.get_worker_shards(rng))
+        if self.shuffle_buffer_size > 0:
+            samples = shuffled(samples, self.shuffle_buffer_size, rng)
+        for sample, record in samples:
+            target = record['target']
+            if self.transform is not None:
+                sample = self.transform(sample)
+            if self.target_transform is not None:
+                target = self.target_transform(target)
+            yield sample, target
@@ -0,0 +1,251 @@
+"""Detection of images with equal pixels across all data sources
+and of similar frames of the same animation.
+"""
+
+import hashlib
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pokemon_image_dataset.data_sources import DataSource
+from pokemon_image_dataset.export import get_data_repo_path
+from pokemon_image_dataset.form import BasePokemonImage, PokemonForm, sort_images
+from pokemon_image_dataset.normalize import resample
+from pokemon_image_dataset.utils import process_map, read_image
+
+DUPLICATE_POLICIES = ('remove', 'link', 'report')
+PERCEPTUAL_HASH_SIZE = 16
+NEAR_DUPLICATE_THRESHOLD = 8
+"""Maximum number of differing bits (of `PERCEPTUAL_HASH_SIZE ** 2`) of near-duplicate frames."""
+
+
+def pixel_digest(filename: Path) -> str:
+    """SHA-256 of the decoded pixels.
+    Files that only differ in their format, compression or metadata have the same digest.
+    """
+    img = read_image(filename)
+    hash_sha256 = hashlib.sha256(str(img.shape).encode())
+    hash_sha256.update(np.ascontiguousarray(img).data)
+    return hash_sha256.hexdigest()
+
+
+def perceptual_hash(filename: Path, hash_size: int = PERCEPTUAL_HASH_SIZE) -> int:
+    """Difference hash (dHash) of the image:
+    Each bit tells whether a pixel of the downscaled grayscale image
+    is brighter than its right neighbour.
+    Similar images have hashes with a small Hamming distance.
+    """
+    img = read_image(filename)
+    gray = img.mean(axis=-1, keepdims=True).astype(np.uint8)
+    small = resample(gray[np.newaxis], height=hash_size, width=hash_size + 1)[0, ..., 0]
+    bits = (small[:, 1:] < small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree of hashes with the Hamming distance as metric.
+    Searching for hashes within a small distance only visits a small part of the tree
+    because of the triangle inequality.
+    """
+
+    def __init__(self):
+        self.root: Optional[Tuple[int, List[Any], Dict[int, tuple]]] = None
+        """A node is a tuple of a hash, the items with that hash and the children by distance."""
+
+    def add(self, hash_value: int, item: Any) -> None:
+        if self.root is None:
+            self.root = (hash_value, [item], {})
+            return
+        node = self.root
+        while True:
+            node_hash, items, children = node
+            distance = hamming_distance(hash_value, node_hash)
+            if distance == 0:
+                items.append(item)
+                return
+            if distance not in children:
+                children[distance] = (hash_value, [item], {})
+                return
+            node = children[distance]
+
+    def find(self, hash_value: int, max_distance: int) -> List[Any]:
+        """Items whose hashes are at most `max_distance` apart from `hash_value`."""
+        found = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_hash, items, children = nodes.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                found.extend(items)
+            nodes.extend(
+                child
+                for child_distance, child in children.items()
+                if distance - max_distance <= child_distance <= distance + max_distance
+            )
+        return found
+
+
+def find_duplicates(
+    images: Sequence[BasePokemonImage],
+    digests: Sequence[str],
+) -> Dict[BasePokemonImage, BasePokemonImage]:
+    """Maps each image to the first image (in the given order)
+    of the same pokemon with the same pixel digest.
+    Images of different pokemon are never duplicates of each other.
+    """
+    originals: Dict[Tuple[int, str], BasePokemonImage] = {}
+    duplicates = {}
+    for image, digest in zip(images, digests):
+        original = originals.setdefault((image.form.ndex, digest), image)
+        if original.source_file != image.source_file:
+            duplicates[image] = original
+    return duplicates
+
+
+def link(src: Path, dest: Path) -> None:
+    """Replaces `dest` by a hard link to `src`."""
+    tmp = dest.with_name(f'.{dest.name}.link')
+    tmp.unlink(missing_ok=True)
+    os.link(src, tmp)
+    os.replace(tmp, dest)
+
+
+def remove_duplicates(
+    data_sources: List[DataSource],
+    policy: str = 'remove',
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+) -> Dict[BasePokemonImage, BasePokemonImage]:
+    """Finds images of the same pokemon with equal pixels across all data sources
+    by hashing each image once.
+    The first image in the order of the data sources and their sorted images is kept.
+    Depending on the `policy`, the other images are
+    - 'remove': excluded from this run (see `exclude_images`),
+    - 'link': excluded from this run until `link_duplicates` adds them back
+      as hard links to the kept images' normalized files,
+    - 'report': only counted.
+    Returns the duplicates and the images they are duplicates of.
+    """
+    assert policy in DUPLICATE_POLICIES, (
+        f'invalid policy "{policy}", must be 1 of {", ".join(DUPLICATE_POLICIES)}'
+    )
+    images = [
+        image
+        for data_source in data_sources
+        for image in sort_images(data_source.images)
+    ]
+    digests = process_map(
+        pixel_digest,
+        [image.source_file for image in images],
+        workers=workers,
+        chunksize=chunksize,
+    )
+    duplicates = find_duplicates(images, digests)
+    count_by_sprite_set(duplicates, 'duplicates')
+
+    if policy in ('remove', 'link'):
+        exclude_images(data_sources, duplicates)
+    return duplicates
+
+
+def link_duplicates(
+    data_sources: List[DataSource],
+    duplicates: Dict[BasePokemonImage, BasePokemonImage],
+    data_repo: Path,
+) -> None:
+    """Replaces the normalized files of the duplicates in the `data_repo` (see `get_data_repo_path`)
+    by hard links to the normalized files of the images they are duplicates of
+    and adds the duplicates back to their data sources.
+    Duplicates of images that have been excluded since (e.g. as near duplicates) stay excluded.
+    """
+    included = {image for data_source in data_sources for image in data_source.images}
+    linked = sort_images(image for image, original in duplicates.items() if original in included)
+    for image in linked:
+        dest = data_repo / get_data_repo_path(image)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        link(data_repo / get_data_repo_path(duplicates[image]), dest)
+    for data_source in data_sources:
+        data_source.images = data_source.images | {
+            image
+            for image in linked
+            if image.data_source_name == data_source.__class__.__name__
+        }
+    print(f'{len(linked)} duplicates linked')
+
+
+def find_near_duplicate_frames(
+    frames: Sequence[BasePokemonImage],
+    hashes: Sequence[int],
+    threshold: int = NEAR_DUPLICATE_THRESHOLD,
+) -> Dict[BasePokemonImage, BasePokemonImage]:
+    """Maps each frame to an earlier frame (in the given order) of the same form
+    and sprite set whose perceptual hash differs in at most `threshold` bits.
+    Only frames that are not near duplicates themselves are compared with.
+    Each animation (form and sprite set) has its own tree,
+    so frames are never compared with frames of other animations.
+    """
+    trees: Dict[Tuple[str, PokemonForm], BKTree] = {}
+    near_duplicates = {}
+    for frame, hash_value in zip(frames, hashes):
+        tree = trees.setdefault((frame.source_file.parent.name, frame.form), BKTree())
+        similar = tree.find(hash_value, threshold)
+        if similar:
+            near_duplicates[frame] = similar[0]
+        else:
+            tree.add(hash_value, frame)
+    return near_duplicates
+
+
+def remove_near_duplicate_frames(
+    data_sources: List[DataSource],
+    threshold: int = NEAR_DUPLICATE_THRESHOLD,
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+) -> Dict[str, int]:
+    """Excludes animation frames that look almost the same as another frame
+    of the same form in the same sprite set (see `find_near_duplicate_frames`)
+    from the current run (see `exclude_images`).
+    Earlier frames are kept.
+    Returns the number of excluded frames per sprite set.
+    """
+    frames = [
+        image
+        for data_source in data_sources
+        for image in sort_images(data_source.images)
+        if getattr(image, 'frame', None) is not None
+    ]
+    hashes = process_map(
+        perceptual_hash,
+        [frame.source_file for frame in frames],
+        workers=workers,
+        chunksize=chunksize,
+    )
+    near_duplicates = find_near_duplicate_frames(frames, hashes, threshold)
+    exclude_images(data_sources, near_duplicates)
+    return count_by_sprite_set(near_duplicates, 'near-duplicate frames')
+
+
+def exclude_images(data_sources: List[DataSource], images: Collection[BasePokemonImage]) -> None:
+    """Removes the images from their data sources for the current run only.
+    Neither their files nor the data sources' saved states are changed,
+    so the next run starts from all images again (e.g. with another policy).
+    """
+    for data_source in data_sources:
+        remaining = {image for image in data_source.images if image not in images}
+        if len(remaining) < len(data_source.images):
+            data_source.images = remaining
+
+
+def count_by_sprite_set(images: Collection[BasePokemonImage], description: str) -> Dict[str, int]:
+    counts = Counter(image.source_file.parent.name for image in images)
+    for sprite_set, count in sorted(counts.items()):
+        print(f'{sprite_set}: {count} {description}')
+    print(f'{len(images)} {description} in total')
+    return dict(counts)
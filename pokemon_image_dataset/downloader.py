@@ -0,0 +1,206 @@
+"""HTTP downloads of (large) archives."""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pokemon_image_dataset.utils import sha256sum, write_checksum_sidecar
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class RetryableHTTPError(requests.HTTPError):
+    """Server errors (5xx) and rate limiting (429)."""
+
+
+RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    RetryableHTTPError,
+)
+
+
+class Downloader:
+    """Downloads files using a shared connection pool.
+    Interrupted downloads are resumed with range requests, both within a download
+    (up to `retries` times with exponential backoff) and across runs (from the `.part` file).
+    With `segments > 1`, files are fetched in that many parallel ranges if the server supports it.
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 30,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        segments: int = 1,
+        pool_size: int = 10,
+    ):
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.segments = segments
+
+    def download(self, url: str, dest: Path, checksum: Optional[str] = None) -> str:
+        """Downloads to `<dest>.part` and moves the file to `dest`
+        if it matches the expected `checksum` (if given), otherwise a `ValueError` is raised.
+        Returns the SHA-256 checksum.
+        """
+        print(f'downloading {url} to {dest}')
+        tmp = dest.with_name(f'{dest.name}.part')
+        size = self.get_segmentable_size(url) if self.segments > 1 else None
+        if size is None:
+            actual = self.download_stream(url, tmp)
+        else:
+            self.download_segments(url, tmp, size)
+            actual = sha256sum(tmp)
+
+        if checksum is not None and actual != checksum:
+            tmp.unlink()
+            raise ValueError(
+                f'invalid checksum for {url}. expected {checksum} but got {actual}'
+            )
+        os.replace(tmp, dest)
+        if checksum is not None:
+            write_checksum_sidecar(dest, actual)
+        return actual
+
+    def retry(self, func, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                return func(*args)
+            except RETRYABLE_ERRORS as error:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                print(f'{error}, retrying in {delay}s')
+                time.sleep(delay)
+
+    def get(self, url: str, start: int = 0, end: Optional[int] = None) -> requests.Response:
+        """Requests the bytes from `start` to `end` (inclusive) if given."""
+        headers = {}
+        if start > 0 or end is not None:
+            headers['Range'] = f'bytes={start}-{"" if end is None else end}'
+        response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.close()
+            raise RetryableHTTPError(f'{response.status_code} for {url}', response=response)
+        return response
+
+    def download_stream(self, url: str, tmp: Path) -> str:
+        """Downloads sequentially while hashing and returns the checksum.
+        An existing partial file is resumed.
+        """
+        hash_sha256 = hashlib.sha256()
+        if tmp.exists():
+            print(f'resuming {tmp}')
+            with open(tmp, 'rb') as file:
+                for chunk in iter(lambda: file.read(self.chunk_size), b''):
+                    hash_sha256.update(chunk)
+        else:
+            tmp.touch()
+
+        def attempt():
+            nonlocal hash_sha256
+
+            offset = tmp.stat().st_size
+            with self.get(url, start=offset) as response:
+                if offset > 0 and response.status_code == 416:
+                    # The partial file is already complete.
+                    return
+                response.raise_for_status()
+                mode = 'ab'
+                if offset > 0 and response.status_code != 206:
+                    print(f'server does not support resuming {url}, restarting')
+                    hash_sha256 = hashlib.sha256()
+                    mode = 'wb'
+                with open(tmp, mode) as file:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        file.write(chunk)
+                        hash_sha256.update(chunk)
+
+        self.retry(attempt)
+        return hash_sha256.hexdigest()
+
+    def get_segmentable_size(self, url: str) -> Optional[int]:
+        """Size of the file if it can be downloaded in ranges."""
+        response = self.retry(
+            lambda: self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        )
+        if response.ok and response.headers.get('Accept-Ranges') == 'bytes':
+            size = response.headers.get('Content-Length')
+            if size is not None and int(size) >= self.segments * self.chunk_size:
+                return int(size)
+        return None
+
+    def download_segments(self, url: str, tmp: Path, size: int) -> None:
+        with open(tmp, 'wb') as file:
+            file.truncate(size)
+
+        segment_size = -(-size // self.segments)
+        bounds = [
+            (start, min(start + segment_size, size) - 1)
+            for start in range(0, size, segment_size)
+        ]
+
+        def download_segment(start: int, end: int):
+            position = start
+
+            def attempt():
+                nonlocal position
+
+                with self.get(url, start=position, end=end) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise requests.HTTPError(f'range requests not supported for {url}')
+                    with open(tmp, 'r+b') as file:
+                        file.seek(position)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            file.write(chunk)
+                            position += len(chunk)
+                if position <= end:
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f'incomplete range {start}-{end} of {url}'
+                    )
+
+            self.retry(attempt)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.segments) as executor:
+                for future in [executor.submit(download_segment, start, end) for start, end in bounds]:
+                    future.result()
+        except Exception:
+            # The preallocated file cannot be resumed.
+            tmp.unlink()
+            raise
+
+
+_default_downloader: Optional[Downloader] = None
+
+
+def get_default_downloader() -> Downloader:
+    global _default_downloader
+
+    if _default_downloader is None:
+        _default_downloader = Downloader()
+    return _default_downloader
+
+
+def download(url: str, dest: Path, checksum: Optional[str] = None) -> str:
+    """Downloads using the shared default `Downloader`."""
+    return get_default_downloader().download(url, dest, checksum=checksum)
@@ -0,0 +1,133 @@
+"""Export formats of the final dataset besides the folder of pngs per pokemon.
+Each format contains the same images as the data repo together with an index of their metadata.
+"""
+
+import io
+import json
+import os
+import random
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from pokemon_image_dataset.form import PokemonImage
+from pokemon_image_dataset.utils import read_image
+
+PACKED_IMAGES_FILE = 'images.npy'
+PACKED_INDEX_FILE = 'index.json'
+SHARDS_INDEX_FILE = 'shards.json'
+SHARD_SIZE = 1000
+"""Number of images per shard."""
+
+
+def get_classes(images: Sequence[PokemonImage]) -> List[str]:
+    """Class names like `torchvision.datasets.ImageFolder` finds them in the data repo,
+    i.e. the sorted names of the folders per ndex.
+    """
+    return sorted({str(image.form.ndex) for image in images})
+
+
+def get_data_repo_path(image: PokemonImage) -> str:
+    """Path of the normalized image in the data repo (relative to its root)."""
+    return f'{image.form.ndex}/{image.filename}'
+
+
+def get_record(image: PokemonImage, class_to_idx: Dict[str, int]) -> Dict[str, Any]:
+    """Metadata of an exported image.
+    `path` is the image's file in the data repo (see `get_data_repo_path`).
+    """
+    return {
+        'path': get_data_repo_path(image),
+        'target': class_to_idx[str(image.form.ndex)],
+        'ndex': image.form.ndex,
+        'form_name': image.form.form_name,
+        'sprite_set': image.sprite_set,
+        'frame': image.frame,
+    }
+
+
+def get_records(images: Sequence[PokemonImage]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    classes = get_classes(images)
+    class_to_idx = {cls: i for i, cls in enumerate(classes)}
+    return classes, [get_record(image, class_to_idx) for image in images]
+
+
+def export_packed(
+    images: Sequence[PokemonImage],
+    data_repo: Path,
+    dest: Path,
+    final_size: Tuple[int, int],
+) -> None:
+    """Writes the normalized images of the `data_repo` into 1 uint8 array of shape (N, height, width, 3)
+    (see `PACKED_IMAGES_FILE`) and their metadata (see `PACKED_INDEX_FILE`) to `dest`.
+    The array is a `.npy` file so it can be memory-mapped with `np.load(..., mmap_mode='r')`.
+    """
+    width, height = final_size
+    shape = (len(images), height, width, 3)
+    dest.mkdir(parents=True, exist_ok=True)
+
+    images_file = dest / PACKED_IMAGES_FILE
+    tmp = images_file.with_name(f'.{images_file.stem}.tmp{images_file.suffix}')
+    packed = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=shape)
+    for i, image in enumerate(images):
+        filename = data_repo / get_data_repo_path(image)
+        img = read_image(filename)
+        assert img.shape == shape[1:], (
+            f'expected normalized image of shape {shape[1:]} but got {img.shape} for {filename}'
+        )
+        packed[i] = img
+    packed.flush()
+    del packed
+    os.replace(tmp, images_file)
+
+    classes, records = get_records(images)
+    with open(dest / PACKED_INDEX_FILE, 'w') as file:
+        json.dump({'shape': shape, 'classes': classes, 'samples': records}, file)
+
+
+def get_shard_filename(shard: int) -> str:
+    return f'shard-{shard:05d}.tar'
+
+
+def add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_shards(
+    images: Sequence[PokemonImage],
+    data_repo: Path,
+    dest: Path,
+    shard_size: int = SHARD_SIZE,
+    seed: int = 0,
+) -> None:
+    """Writes the normalized image files of the `data_repo` into tar archives (see `get_shard_filename`)
+    of `shard_size` images each (except for the last one)
+    and an index of the shards and classes (see `SHARDS_INDEX_FILE`) to `dest`.
+    Each image is followed by a json file with its metadata (see `get_record`).
+    Both files have the image's data repo path without suffix as name.
+    The images are shuffled with the `seed` before so that each shard contains many pokemon.
+    """
+    classes, records = get_records(images)
+    samples = list(zip(images, records))
+    random.Random(seed).shuffle(samples)
+    dest.mkdir(parents=True, exist_ok=True)
+
+    shards = []
+    for start in range(0, len(samples), shard_size):
+        shard = samples[start:start + shard_size]
+        shard_file = dest / get_shard_filename(len(shards))
+        tmp = shard_file.with_name(f'.{shard_file.name}.tmp')
+        with tarfile.open(tmp, 'w') as tar:
+            for image, record in shard:
+                key = os.path.splitext(record['path'])[0]
+                add_bytes(tar, f'{key}{image.format}', (data_repo / record['path']).read_bytes())
+                add_bytes(tar, f'{key}.json', json.dumps(record).encode())
+        os.replace(tmp, shard_file)
+        shards.append({'filename': shard_file.name, 'size': len(shard)})
+
+    with open(dest / SHARDS_INDEX_FILE, 'w') as file:
+        json.dump({'classes': classes, 'shards': shards}, file)
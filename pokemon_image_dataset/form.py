@@ -12,17 +12,18 @@ start happening from generation 5:
 """
 
 import itertools
+import sys
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, fields
+from operator import attrgetter
 from pathlib import Path
-from typing import Any, Union, TypedDict, Optional, TYPE_CHECKING
+from typing import Any, ClassVar, Iterable, TypeVar, Union, TypedDict, Optional, TYPE_CHECKING
 
-from wand.image import Image
-
-from pokemon_image_dataset.utils import name, NAME_DELIMITER, get_bbox
+from pokemon_image_dataset.utils import BBox, name, NAME_DELIMITER, get_array_bbox, read_image
 
 if TYPE_CHECKING:
-    from pokemon_image_dataset.data_sources import DataSource, SpriteSetDataSource
+    from pokemon_image_dataset.cache import BBoxIndex
+    from pokemon_image_dataset.data_sources import DataSource
 
 DISMISS_FORM = object()
 
@@ -64,19 +65,70 @@ class PokemonForm:
             return name(str(self.ndex), self.form_name)
 
 
+def add_slots(*extra: str):
+    """Recreates a dataclass with `__slots__` for its fields and the `extra` attributes
+    like `dataclass(slots=True)` does since Python 3.10.
+    """
+
+    def decorator(cls: type) -> type:
+        inherited = {
+            slot
+            for base in cls.__mro__[1:]
+            for slot in getattr(base, '__slots__', ())
+        }
+        field_names = tuple(field.name for field in fields(cls))
+        cls_dict = dict(cls.__dict__)
+        cls_dict['__slots__'] = tuple(
+            slot
+            for slot in (*field_names, *extra)
+            if slot not in inherited
+        )
+        # Default values are class attributes which conflict with the slots.
+        # The generated `__init__` has its own copy of them.
+        for field_name in field_names:
+            cls_dict.pop(field_name, None)
+        cls_dict.pop('__dict__', None)
+        cls_dict.pop('__weakref__', None)
+        slotted = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+        slotted.__qualname__ = cls.__qualname__
+        return slotted
+
+    return decorator
+
+
+@add_slots('_sort_key', '_bbox')
 @dataclass(frozen=True)
 class BasePokemonImage(ABC):
     """Specifies a concrete image of a pokemon.
     This class implies the image's target filename.
+
+    Instances are slotted and reference their data source by (class) name only,
+    so they are small and cheap to pickle.
     """
-    data_source: 'DataSource'
+    data_source_name: str
     form: PokemonForm
     source_file: Path
+    bbox_index: ClassVar[Optional['BBoxIndex']] = None
+    """If set, bounding boxes are looked up in (and added to) this index."""
+
+    def __post_init__(self):
+        # Bypass the frozen dataclass' __setattr__.
+        object.__setattr__(self, 'data_source_name', sys.intern(self.data_source_name))
+        object.__setattr__(self, '_sort_key', self.get_sort_key())
+
+    def __getstate__(self) -> list:
+        return [getattr(self, field.name) for field in fields(self)]
+
+    def __setstate__(self, state: list) -> None:
+        for field, value in zip(fields(self), state):
+            object.__setattr__(self, field.name, value)
+        # Unpickled strings are not interned.
+        self.__post_init__()
 
     def __lt__(self, other):
         if isinstance(other, BasePokemonImage):
             try:
-                return self.sort_key < other.sort_key
+                return self._sort_key < other._sort_key
             except TypeError:
                 print('image __lt__ ??')
                 print(self, other)
@@ -90,16 +142,55 @@ class BasePokemonImage(ABC):
 
     @property
     def sort_key(self) -> tuple:
+        return self._sort_key
+
+    def get_sort_key(self) -> tuple:
+        # The source file comes last and makes the key unique.
+        # Otherwise, images of the same form would be ordered by (hash dependent) set order.
         return (
-            self.data_source.__class__.__name__,
+            self.data_source_name,
             self.form.ndex,
             self.form.form_name,
+            str(self.source_file),
         )
 
     @property
-    def bbox(self) -> tuple[Any, ...]:
-        with Image(filename=self.source_file) as image:
-            return get_bbox(image)
+    def bbox(self) -> BBox:
+        """Memoized until the source file changes."""
+        stat = self.source_file.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        memo = getattr(self, '_bbox', None)
+        if memo is None or memo[0] != signature:
+            if self.bbox_index is None:
+                bbox = get_array_bbox(read_image(self.source_file), filename=self.source_file)
+            else:
+                bbox = self.bbox_index.get(self.source_file)
+            memo = (signature, bbox)
+            # Bypass the frozen dataclass' __setattr__.
+            object.__setattr__(self, '_bbox', memo)
+        return memo[1]
+
+    def to_dict(self, root: Path) -> dict[str, Any]:
+        """Serializes the image to JSON compatible data.
+        The data source is omitted and the source file is stored relative to `root`.
+        """
+        data = {
+            field.name: getattr(self, field.name)
+            for field in fields(self)
+            if field.name != 'data_source_name'
+        }
+        data['form'] = asdict(self.form)
+        data['source_file'] = str(self.source_file.relative_to(root))
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], data_source: 'DataSource', root: Path) -> 'BasePokemonImage':
+        return cls(**{
+            **data,
+            'data_source_name': data_source.__class__.__name__,
+            'form': PokemonForm(**data['form']),
+            'source_file': root / data['source_file'],
+        })
 
     # @abstractmethod
     # def split(
@@ -122,22 +213,33 @@ class BasePokemonImage(ABC):
     #     ...
 
 
+ImageT = TypeVar('ImageT', bound=BasePokemonImage)
+
+
+def sort_images(images: Iterable[ImageT]) -> list[ImageT]:
+    """Same as `sorted(images)` but compares the precomputed sort keys directly
+    instead of calling `__lt__` for each comparison.
+    """
+    return sorted(images, key=attrgetter('_sort_key'))
+
+
 class PokemonImageKwargs(TypedDict):
     source_file: Path
-    data_source: Optional['SpriteSetDataSource']
+    data_source_name: Optional[str]
     form: Optional[PokemonForm]
     format: Optional[str]
     sprite_set: Optional[str]
     frame: Optional[int]
 
 
+@add_slots()
 @dataclass(frozen=True)
 class PokemonImage(BasePokemonImage):
-    data_source: 'SpriteSetDataSource'
+    data_source_name: str
     form: PokemonForm
     source_file: Path
     sprite_set: str
-    """A key of 'self.data_source.sprite_sets'."""
+    """The name of the sprite set's destination folder."""
     frame: Optional[int] = None
     format: str = '.png'
 
@@ -151,7 +253,7 @@ class PokemonImage(BasePokemonImage):
     #     return [
     #         PokemonImage(
     #             source_file=filename_or_image,
-    #             data_source=self.data_source,
+    #             data_source_name=self.data_source_name,
     #             form=self.form,
     #             sprite_set=self.sprite_set,
     #             frame=self.frame,
@@ -163,9 +265,20 @@ class PokemonImage(BasePokemonImage):
     #         if filename_or_image is not None
     #     ]
 
-    @property
-    def sort_key(self) -> tuple:
-        return *super().sort_key, self.frame is self.frame if not None else 0
+    # NOTE: `super()` without arguments does not work in slotted classes
+    #  because it refers to the class before `add_slots` recreated it.
+    def __post_init__(self):
+        object.__setattr__(self, 'sprite_set', sys.intern(self.sprite_set))
+        BasePokemonImage.__post_init__(self)
+
+    def get_sort_key(self) -> tuple:
+        *form_key, source_file = BasePokemonImage.get_sort_key(self)
+        return (
+            *form_key,
+            self.sprite_set,
+            self.frame if self.frame is not None else 0,
+            source_file,
+        )
 
     @property
     def filename(self) -> str:
@@ -234,9 +347,28 @@ def get_forms(forms_by_ndex) -> dict[int, list[PokemonForm]]:
     }
 
 
+class FormRegistry:
+    """Indexes forms by (ndex, form name) and by name (the canonical filename stem).
+    Lookups return all matching forms so that callers can detect ambiguities.
+    """
+
+    def __init__(self, forms_by_ndex: dict[int, list[PokemonForm]]):
+        self.by_form_name: dict[tuple[int, str], list[PokemonForm]] = {}
+        self.by_name: dict[str, list[PokemonForm]] = {}
+        for forms in forms_by_ndex.values():
+            for form in forms:
+                self.by_form_name.setdefault((form.ndex, form.form_name), []).append(form)
+                self.by_name.setdefault(form.name, []).append(form)
+
+    def find(self, ndex: int, form_name: str) -> list[PokemonForm]:
+        return self.by_form_name.get((ndex, form_name), [])
+
+    def find_by_name(self, ndex: int, name: str) -> list[PokemonForm]:
+        return [form for form in self.by_name.get(name, []) if form.ndex == ndex]
+
+
 def get_form(ndex: int, form_name: str, strict: bool = True) -> Optional[PokemonForm]:
-    forms = POKEMON_FORMS[ndex]
-    matches = [f for f in forms if f.form_name == form_name]
+    matches = FORM_REGISTRY.find(ndex, form_name)
     if not matches and not strict:
         return None
     else:
@@ -493,3 +625,4 @@ POKEMON_FORMS = get_forms({
     893: 'dada',  # Zarude
     898: ('ice-rider', 'shadow-rider'),  # Calyrex
 })
+FORM_REGISTRY = FormRegistry(POKEMON_FORMS)
@@ -0,0 +1,198 @@
+"""Normalization of images to a common size.
+Each image is decoded once into an array,
+cropped, scaled and padded in memory and encoded once.
+Images with equal cropped shapes are scaled together.
+"""
+
+import math
+import os
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pokemon_image_dataset.utils import (BBox, extent_center, get_array_bbox, get_array_bboxes,
+                                         get_scaling_factor, read_image)
+
+PADDING = 1
+# This values are arbitrary such that 48x48 can be upscaled well and only 128x128 needs to be downscaled.
+# This way, we don't loose to much information while also avoiding unnecessarily large images.
+FINAL_SIZE = (96, 96)
+
+
+@lru_cache(maxsize=None)
+def get_resampling_weights(in_size: int, out_size: int) -> np.ndarray:
+    """Matrix of shape (out_size, in_size) that resamples 1 axis with a triangle (linear) filter.
+    When downscaling, the filter is widened by the inverse scaling factor
+    which anti-aliases the result.
+    """
+    factor = out_size / in_size
+    support = max(1.0, 1 / factor)
+    # Centers of the output pixels in input coordinates.
+    centers = (np.arange(out_size) + 0.5) / factor - 0.5
+    distances = (centers[:, np.newaxis] - np.arange(in_size)[np.newaxis, :]) / support
+    weights = np.clip(1 - np.abs(distances), 0, None)
+    weights = (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+    # The cached array is shared.
+    weights.setflags(write=False)
+    return weights
+
+
+def resample(imgs: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Resamples a stack of RGB uint8 arrays of shape (N, H, W, C) to (N, height, width, C)."""
+    _, in_height, in_width, _ = imgs.shape
+    rows = get_resampling_weights(in_height, height)
+    cols = get_resampling_weights(in_width, width)
+    # (N, C, H, W) so that the matrix products apply to the last 2 axes of each channel.
+    channels = imgs.transpose(0, 3, 1, 2).astype(np.float32)
+    resampled = rows @ channels @ cols.T
+    return np.rint(np.clip(resampled, 0, 255)).astype(np.uint8).transpose(0, 2, 3, 1)
+
+
+def repeat_pixels(imgs: np.ndarray, factor: int) -> np.ndarray:
+    """Nearest neighbour upscaling of a stack of arrays of shape (N, H, W, C) by an integer factor."""
+    num, height, width, channels = imgs.shape
+    blocks = np.broadcast_to(
+        imgs[:, :, np.newaxis, :, np.newaxis, :],
+        (num, height, factor, width, factor, channels),
+    )
+    return blocks.reshape(num, height * factor, width * factor, channels)
+
+
+def scale(imgs: np.ndarray, factor: float, integer_scaling: bool = False) -> np.ndarray:
+    """Scales a stack of RGB uint8 arrays of shape (N, H, W, C).
+    Integer factors repeat pixels, which is fast and keeps pixel art sharp.
+    Other factors are resampled with anti-aliasing.
+    With `integer_scaling`, upscaling always uses the largest integer factor
+    not exceeding `factor`, so the result may be a bit smaller.
+    """
+    if integer_scaling and factor >= 1:
+        factor = math.floor(factor)
+    if factor >= 1 and math.isclose(factor, round(factor)):
+        return repeat_pixels(imgs, round(factor))
+
+    _, height, width, _ = imgs.shape
+    return resample(
+        imgs,
+        height=max(1, round(height * factor)),
+        width=max(1, round(width * factor)),
+    )
+
+
+def crop(img: np.ndarray, bbox: BBox) -> np.ndarray:
+    min_row, min_col, max_row, max_col = bbox
+    return img[min_row:max_row, min_col:max_col]
+
+
+def normalize_many(
+    imgs: Sequence[np.ndarray],
+    final_size: Tuple[int, int],
+    padding: int,
+    bboxes: Optional[Sequence[BBox]] = None,
+    integer_scaling: bool = False,
+    filenames: Optional[Sequence] = None,
+) -> List[np.ndarray]:
+    """Crops RGB uint8 arrays to their bounding boxes and scales and pads them to `final_size`.
+    Cropped images of equal shape share the scaling factor and are scaled at once.
+    """
+    if bboxes is None:
+        bboxes = get_array_bboxes(imgs, filenames=filenames)
+
+    cropped = [crop(img, bbox) for img, bbox in zip(imgs, bboxes)]
+    indices_by_shape: Dict[tuple, List[int]] = defaultdict(list)
+    for i, img in enumerate(cropped):
+        indices_by_shape[img.shape].append(i)
+
+    results: List[Optional[np.ndarray]] = [None] * len(imgs)
+    for indices in indices_by_shape.values():
+        factor = get_scaling_factor(bboxes[indices[0]], final_size=final_size, padding=padding)
+        scaled = scale(
+            np.stack([cropped[i] for i in indices]),
+            factor,
+            integer_scaling=integer_scaling,
+        )
+        for i, img in zip(indices, scaled):
+            results[i] = extent_center(img, width=final_size[0], height=final_size[1])
+    return results
+
+
+def normalize(
+    img: np.ndarray,
+    final_size: Tuple[int, int],
+    padding: int,
+    bbox: Optional[BBox] = None,
+    integer_scaling: bool = False,
+    filename=None,
+) -> np.ndarray:
+    """Crops an RGB uint8 array to its bounding box and scales and pads it to `final_size`."""
+    if bbox is None:
+        bbox = get_array_bbox(img, filename=filename)
+    return normalize_many(
+        [img],
+        final_size=final_size,
+        padding=padding,
+        bboxes=[bbox],
+        integer_scaling=integer_scaling,
+    )[0]
+
+
+def normalize_files(
+    filenames: Sequence[Path],
+    final_size: Tuple[int, int],
+    padding: int,
+    integer_scaling: bool = False,
+    dests: Optional[Sequence[Path]] = None,
+    bboxes: Optional[Sequence[Optional[BBox]]] = None,
+) -> List[BBox]:
+    """Normalizes the image files and writes the results to `dests`
+    (defaults to overwriting the files).
+    Only the bounding boxes that are not given (or `None`) are computed.
+    Returns the bounding boxes of the original images.
+    """
+    from skimage.io import imsave
+
+    imgs = [read_image(filename) for filename in filenames]
+    if bboxes is None:
+        bboxes = [None] * len(imgs)
+    missing = [i for i, bbox in enumerate(bboxes) if bbox is None]
+    computed = dict(zip(missing, get_array_bboxes(
+        [imgs[i] for i in missing],
+        filenames=[filenames[i] for i in missing],
+    )))
+    bboxes = [computed.get(i, bbox) for i, bbox in enumerate(bboxes)]
+    results = normalize_many(
+        imgs,
+        final_size=final_size,
+        padding=padding,
+        bboxes=bboxes,
+        integer_scaling=integer_scaling,
+    )
+    if dests is None:
+        dests = filenames
+    for dest, res in zip(dests, results):
+        # Replace the file instead of writing to it, so files hard linked to it
+        # by a previous run (see `pokemon_image_dataset.dedup.link_duplicates`) are not changed.
+        # The process ID keeps temporary files of concurrent workers apart.
+        tmp = dest.with_name(f'.{dest.stem}.{os.getpid()}.tmp{dest.suffix}')
+        imsave(str(tmp), res, check_contrast=False)
+        os.replace(tmp, dest)
+    return bboxes
+
+
+def normalize_file(
+    filename: Path,
+    final_size: Tuple[int, int],
+    padding: int,
+    integer_scaling: bool = False,
+) -> BBox:
+    """Normalizes the image file in place.
+    Returns the bounding box of the original image.
+    """
+    return normalize_files(
+        [filename],
+        final_size=final_size,
+        padding=padding,
+        integer_scaling=integer_scaling,
+    )[0]
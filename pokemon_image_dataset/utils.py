@@ -1,15 +1,22 @@
 import hashlib
+import io
+import json
+import os
 import shutil
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union, Sequence, Tuple, List
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-import requests
-from skimage.color import rgb2gray
-from skimage.measure import label, regionprops
-from wand.color import Color
-from wand.drawing import Drawing
-from wand.image import Image
+
+# scipy, skimage and wand are slow to import, so they are imported where they are used.
+if TYPE_CHECKING:
+    import PIL.Image
+    from wand.image import Image
 
 PathLike = Union[str, Path]
 
@@ -35,33 +42,128 @@ def parse_ndex(filename: str) -> int:
     return int(ndex_str)
 
 
+###############################################################################
+# LOGGING
+class ThreadLocalStdout(io.TextIOBase):
+    """Replacement for `sys.stdout` that writes to a per thread target if set."""
+
+    def __init__(self, default):
+        super().__init__()
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def target(self):
+        return getattr(self.local, 'target', None) or self.default
+
+    def write(self, s: str) -> int:
+        return self.target.write(s)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+
+_capture_lock = threading.Lock()
+_active_captures = 0
+
+
+@contextmanager
+def capture_output() -> Iterator[io.StringIO]:
+    """Collects everything printed by the current thread in a buffer.
+    Other threads keep printing to the original `sys.stdout`.
+    """
+    global _active_captures
+
+    with _capture_lock:
+        if _active_captures == 0:
+            sys.stdout = ThreadLocalStdout(sys.stdout)
+        _active_captures += 1
+        stdout = sys.stdout
+
+    buffer = io.StringIO()
+    previous_target = getattr(stdout.local, 'target', None)
+    stdout.local.target = buffer
+    try:
+        yield buffer
+    finally:
+        stdout.local.target = previous_target
+        with _capture_lock:
+            _active_captures -= 1
+            if _active_captures == 0:
+                sys.stdout = stdout.default
+
+
+###############################################################################
+# PARALLELISM
+def process_map(
+    func: Callable,
+    *iterables: Sequence,
+    workers: Optional[int] = None,
+    chunksize: int = 1,
+) -> list:
+    """Like `map` but calls the picklable `func` in a process pool
+    (defaults to 1 process per CPU) unless `workers` is 1.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    num_items = min(len(items) for items in iterables)
+    if workers == 1 or num_items <= 1:
+        return list(map(func, *iterables))
+    with ProcessPoolExecutor(max_workers=min(workers, num_items)) as executor:
+        return list(executor.map(func, *iterables, chunksize=chunksize))
+
+
 ###############################################################################
 # DATA SOURCES
-def verify_sha256_checksum(path: Path, expected: str) -> str:
-    chunk_size = 1024 * 64
+def sha256sum(path: Path, chunk_size: int = 1024 * 64) -> str:
     hash_sha256 = hashlib.sha256()
     with open(path, 'rb') as file:
         for chunk in iter(lambda: file.read(chunk_size), b''):
             hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+
+def get_checksum_sidecar(path: Path) -> Path:
+    return path.with_name(f'{path.name}.sha256.json')
+
+
+def get_file_signature(path: Path) -> dict:
+    """Changes (with very high probability) whenever the file is replaced or modified."""
+    stat = path.stat()
+    return {
+        'path': str(path.resolve()),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'inode': stat.st_ino,
+    }
 
-    checksum = hash_sha256.hexdigest()
+
+def write_checksum_sidecar(path: Path, checksum: str) -> None:
+    """Records that the file in its current state has the given checksum."""
+    with open(get_checksum_sidecar(path), 'w') as file:
+        json.dump({**get_file_signature(path), 'sha256': checksum}, file)
+
+
+def verify_sha256_checksum(path: Path, expected: str, reverify: bool = False) -> str:
+    """Verified checksums are recorded in a sidecar file next to `path`.
+    The file is only hashed again if it has changed since (or if `reverify` is set).
+    """
+    sidecar = get_checksum_sidecar(path)
+    if not reverify and sidecar.exists():
+        with open(sidecar) as file:
+            recorded = json.load(file)
+        if recorded == {**get_file_signature(path), 'sha256': expected}:
+            return expected
+
+    checksum = sha256sum(path)
     if checksum != expected:
         raise ValueError(
             f'invalid checksum for {path}. expected {expected} but got {checksum}'
         )
+    write_checksum_sidecar(path, checksum)
     return checksum
 
 
-def download(url: str, dest: Path) -> None:
-    """https://stackoverflow.com/a/16696317/6928824"""
-    print(f'downloading {url} to {dest}')
-    with requests.get(url, stream=True) as response:
-        response.raise_for_status()
-        with open(dest, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=1024 * 16):
-                file.write(chunk)
-
-
 def replace_children_with_grandchildren(parent: Path) -> None:
     """Moves all grandchildren up one level and
     removes the then empty child directories.
@@ -75,7 +177,9 @@ def replace_children_with_grandchildren(parent: Path) -> None:
 
 ###############################################################################
 # IMAGES
-def binarize(img: Image) -> Image:
+def binarize(img: 'Image') -> 'Image':
+    from wand.color import Color
+
     binary = img.clone()
     binary.format = 'png'
     # Set white background.
@@ -88,7 +192,11 @@ def binarize(img: Image) -> Image:
     return binary
 
 
-def get_bbox(img: Image, filename=None):
+def get_bbox(img: 'Image', filename=None):
+    from skimage.color import rgb2gray
+    from skimage.measure import label, regionprops
+    from wand.image import Image
+
     binary = rgb2gray(np.array(binarize(img)))
 
     label_img = label(binary, background=1)
@@ -107,20 +215,143 @@ def get_bbox(img: Image, filename=None):
     return region.bbox
 
 
-# def get_largest_bbox(bboxes) -> Tuple[float, float]:
-#     max_width = 0
-#     max_height = 0
-#     for filename, bbox in bboxes.items():
-#         width, height = bbox_size(bbox)
-#         print(filename, width, height)
-#         if width > max_width:
-#             print('greater width')
-#             max_width = width
-#         if height > max_height:
-#             print('greater height')
-#             max_height = height
+def read_image(filename: PathLike) -> np.ndarray:
+    """Decodes an image into an RGB uint8 array.
+    Transparent areas are composited onto a white background.
+    """
+    from skimage.io import imread
+    from skimage.util import img_as_ubyte
+
+    img = img_as_ubyte(imread(str(filename)))
+    if img.ndim == 2:
+        img = img[..., np.newaxis]
+    # gray + alpha or RGBA
+    if img.shape[-1] in (2, 4):
+        color = img[..., :-1].astype(np.uint16)
+        alpha = img[..., -1:].astype(np.uint16)
+        # This is at most 255 * 255 so uint16 does not overflow.
+        composite = color * alpha + 255 * (255 - alpha)
+        img = ((composite + 127) // 255).astype(np.uint8)
+    if img.shape[-1] == 1:
+        img = np.broadcast_to(img, (*img.shape[:2], 3))
+
+    assert img.shape[-1] == 3, f'image must have 3 channels but got shape {img.shape}'
+    return img
+
+
+BBox = Tuple[int, int, int, int]
+# 8-connectivity like `skimage.measure.label`'s default for 2D images.
+_BBOX_STRUCTURE = np.ones((3, 3), dtype=bool)
+# Same but without connecting pixels of adjacent images in a stack.
+_BATCH_BBOX_STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+_BATCH_BBOX_STRUCTURE[1] = True
+
+
+def get_foreground(img: np.ndarray) -> np.ndarray:
+    """Mask of all non-white pixels of an RGB array (or a stack of them)."""
+    return (img != 255).any(axis=-1)
+
+
+def _largest_bbox(slices: Sequence[Tuple[slice, ...]]) -> BBox:
+    """Bounding box with the largest area (the first one if ambiguous)."""
+    bboxes = [
+        (rows.start, cols.start, rows.stop, cols.stop)
+        for rows, cols in slices
+    ]
+    return max(bboxes, key=lambda bbox: (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]))
+
+
+def _foreground_bbox(foreground: np.ndarray) -> Optional[BBox]:
+    """Bounding box of all foreground pixels or `None` if there are none."""
+    rows = np.flatnonzero(foreground.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(foreground.any(axis=0))
+    return int(rows[0]), int(cols[0]), int(rows[-1]) + 1, int(cols[-1]) + 1
+
 
-#     return max_width, max_height
+def _is_single_object(foreground: np.ndarray) -> bool:
+    """Cheap check without labeling whether a foreground mask (cropped to its bounding box)
+    is 1 object (with 8-connectivity): The pixels of each row must form 1 run
+    that touches the run of the next row.
+    Some single objects (e.g. with white eyes) are not detected.
+    """
+    width = foreground.shape[1]
+    first = foreground.argmax(axis=1)
+    last = width - 1 - foreground[:, ::-1].argmax(axis=1)
+    # Also false for empty rows.
+    if not (foreground.sum(axis=1) == last - first + 1).all():
+        return False
+    return bool(((first[1:] <= last[:-1] + 1) & (first[:-1] <= last[1:] + 1)).all())
+
+
+def get_array_bbox(img: np.ndarray, filename=None) -> BBox:
+    """Like `get_bbox` but for an RGB array as returned by `read_image`.
+    Returns the bounding box of the object (connected non-white pixels)
+    with the largest bounding box.
+    Only images that are not obviously 1 object (see `_is_single_object`) are labeled.
+    """
+    from scipy import ndimage
+
+    foreground = get_foreground(img)
+    bbox = _foreground_bbox(foreground)
+    assert bbox is not None, f'no objects detected for {filename}'
+    min_row, min_col, max_row, max_col = bbox
+    cropped = foreground[min_row:max_row, min_col:max_col]
+    if _is_single_object(cropped):
+        return bbox
+
+    labels, _ = ndimage.label(cropped, structure=_BBOX_STRUCTURE)
+    top, left, bottom, right = _largest_bbox(ndimage.find_objects(labels))
+    return top + min_row, left + min_col, bottom + min_row, right + min_col
+
+
+def get_array_bboxes(imgs: Sequence[np.ndarray], filenames: Sequence = None) -> List[BBox]:
+    """Batched version of `get_array_bbox`.
+    Images of equal shape (usually all images of a sprite set)
+    that are not obviously 1 object are labeled at once.
+    """
+    from scipy import ndimage
+
+    if filenames is None:
+        filenames = [None] * len(imgs)
+
+    bboxes: List[Optional[BBox]] = [None] * len(imgs)
+    indices_by_shape: Dict[tuple, List[int]] = defaultdict(list)
+    for i, img in enumerate(imgs):
+        foreground = get_foreground(img)
+        bbox = _foreground_bbox(foreground)
+        assert bbox is not None, f'no objects detected for {filenames[i]}'
+        min_row, min_col, max_row, max_col = bbox
+        if _is_single_object(foreground[min_row:max_row, min_col:max_col]):
+            bboxes[i] = bbox
+        else:
+            indices_by_shape[img.shape].append(i)
+
+    for indices in indices_by_shape.values():
+        foreground = get_foreground(np.stack([imgs[i] for i in indices]))
+        labels, _ = ndimage.label(foreground, structure=_BATCH_BBOX_STRUCTURE)
+        slices_by_image = defaultdict(list)
+        for image_slice, rows, cols in ndimage.find_objects(labels):
+            slices_by_image[image_slice.start].append((rows, cols))
+        for j, i in enumerate(indices):
+            bboxes[i] = _largest_bbox(slices_by_image[j])
+    return bboxes
+
+
+def get_file_bboxes(filenames: Sequence[PathLike]) -> List[BBox]:
+    return get_array_bboxes([read_image(filename) for filename in filenames], filenames=filenames)
+
+
+def get_largest_bbox_size(bboxes: Iterable[BBox]) -> Tuple[int, int]:
+    """Maximum width and maximum height (not necessarily of the same bounding box)."""
+    max_width = 0
+    max_height = 0
+    for bbox in bboxes:
+        width, height = bbox_size(bbox)
+        max_width = max(max_width, width)
+        max_height = max(max_height, height)
+    return max_width, max_height
 
 
 def bbox_size(bbox: Tuple[int, int, int, int]) -> Tuple[int, int]:
@@ -145,6 +376,7 @@ def extent_gravity_center(img: np.ndarray, width, height):
     with gravity and white background.
     See https://github.com/emcconville/wand/issues/554
     """
+    from wand.image import Image
 
     img = Image.from_array(img)
     img.background_color = 'white'
@@ -158,12 +390,30 @@ def extent_gravity_center(img: np.ndarray, width, height):
     return img
 
 
-def get_image_frames(filename: Path) -> Tuple[Image]:
-    with Image(filename=filename) as img:
-        return tuple(
-            Image(frame, format='png')
-            for frame in img.sequence
-        )
+def extent_center(img: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Same as `extent_gravity_center` but for arrays."""
+    img_height, img_width = img.shape[:2]
+    x = (img_width - width) // 2
+    y = (img_height - height) // 2
+    res = np.full((height, width, *img.shape[2:]), 255, dtype=img.dtype)
+    # Negative offsets mean padding, positive offsets mean cropping.
+    cropped = img[max(y, 0):max(y, 0) + height, max(x, 0):max(x, 0) + width]
+    top = max(-y, 0)
+    left = max(-x, 0)
+    res[top:top + cropped.shape[0], left:left + cropped.shape[1]] = cropped
+    return res
+
+
+def get_image_frames(filename: Path) -> Iterator['PIL.Image.Image']:
+    """Yields each frame of the (animated) image as RGBA image.
+    Frames are decoded one after another while iterating (Pillow decodes a frame when seeking to it),
+    so at most 1 decoded frame (and the previous one for disposal) is held in memory.
+    """
+    from PIL import Image, ImageSequence
+
+    with Image.open(filename) as img:
+        for frame in ImageSequence.Iterator(img):
+            yield frame.convert('RGBA')
 
 
 # def save_image_frames(filename: Path, format: str = '{parent}/{stem}-{frame}{suffix}') -> None:
@@ -177,14 +427,20 @@ def get_image_frames(filename: Path) -> Tuple[Image]:
 
 
 def whiten_areas(filename: Path, coords: List[Tuple[int, int]], save_to: Path = None) -> None:
+    """Flood fills the area of (4-connected) pixels with the same color
+    at each (x, y) coordinate with white.
+    The areas are filled one after another in memory and the image is written once.
+    """
+    from scipy import ndimage
+    from skimage.io import imread, imsave
+
     if save_to is None:
         save_to = filename
 
-    white = Color('white')
-    with Image(filename=filename) as img:
-        for x, y in coords:
-            with Drawing() as draw:
-                draw.fill_color = white
-                draw.color(x, y, 'floodfill')
-                draw.draw(img)
-                img.save(filename=save_to)
+    img = np.array(imread(str(filename)))
+    pixels = img if img.ndim == 3 else img[..., np.newaxis]
+    for x, y in coords:
+        same_color = (pixels == pixels[y, x]).all(axis=-1)
+        labels, _ = ndimage.label(same_color)
+        pixels[labels == labels[y, x]] = 255
+    imsave(str(save_to), img, check_contrast=False)
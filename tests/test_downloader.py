@@ -0,0 +1,160 @@
+"""Tests the `Downloader` against a local HTTP server that supports range requests.
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+
+from pokemon_image_dataset.downloader import Downloader
+
+CONTENT = bytes(range(256)) * 256
+CHECKSUM = hashlib.sha256(CONTENT).hexdigest()
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves `CONTENT` (or a range of it) for any path.
+    The first `server.failures` GET requests are answered with a 503.
+    """
+
+    server: 'LocalServer'
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(CONTENT)))
+        self.end_headers()
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        with self.server.lock:
+            self.server.ranges.append(range_header)
+            fail = self.server.failures > 0
+            if fail:
+                self.server.failures -= 1
+        if fail:
+            self.send_error(503)
+            return
+
+        if range_header is None:
+            self.send_response(200)
+            body = CONTENT
+        else:
+            start, end = range_header[len('bytes='):].split('-')
+            start = int(start)
+            end = int(end) if end else len(CONTENT) - 1
+            if start >= len(CONTENT):
+                self.send_error(416)
+                return
+            body = CONTENT[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{start + len(body) - 1}/{len(CONTENT)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer(ThreadingHTTPServer):
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RangeRequestHandler)
+        self.lock = threading.Lock()
+        self.ranges: List[Optional[str]] = []
+        """Range header of each GET request."""
+        self.failures = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f'http://{host}:{port}/archive.tar.gz'
+
+
+class DownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dest = Path(tmp_dir.name) / 'archive.tar.gz'
+        self.part = self.dest.with_name(f'{self.dest.name}.part')
+
+    def download(self, checksum: Optional[str] = CHECKSUM, **kwargs) -> str:
+        downloader = Downloader(backoff=0, chunk_size=1024, **kwargs)
+        self.addCleanup(downloader.session.close)
+        return downloader.download(self.server.url, self.dest, checksum=checksum)
+
+    def test_download(self):
+        self.assertEqual(self.download(), CHECKSUM)
+        self.assertEqual(self.dest.read_bytes(), CONTENT)
+        self.assertFalse(self.part.exists())
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_resume_from_part_file(self):
+        self.part.write_bytes(CONTENT[:1000])
+        self.assertEqual(self.download(), CHECKSUM)
+        self.assertEqual(self.dest.read_bytes(), CONTENT)
+        self.assertEqual(self.server.ranges, ['bytes=1000-'])
+
+    def test_complete_part_file(self):
+        self.part.write_bytes(CONTENT)
+        self.assertEqual(self.download(), CHECKSUM)
+        self.assertEqual(self.dest.read_bytes(), CONTENT)
+        self.assertEqual(self.server.ranges, [f'bytes={len(CONTENT)}-'])
+
+    def test_retry_on_server_error(self):
+        self.server.failures = 2
+        self.assertEqual(self.download(), CHECKSUM)
+        self.assertEqual(self.dest.read_bytes(), CONTENT)
+        self.assertEqual(len(self.server.ranges), 3)
+
+    def test_give_up_after_retries(self):
+        self.server.failures = 3
+        with self.assertRaises(Exception):
+            self.download(retries=2)
+        self.assertFalse(self.dest.exists())
+        self.assertEqual(len(self.server.ranges), 3)
+
+    def test_segments(self):
+        self.server.failures = 1
+        self.assertEqual(self.download(segments=4), CHECKSUM)
+        self.assertEqual(self.dest.read_bytes(), CONTENT)
+        self.assertFalse(self.part.exists())
+        segment_size = len(CONTENT) // 4
+        self.assertLessEqual(
+            {
+                f'bytes={start}-{start + segment_size - 1}'
+                for start in range(0, len(CONTENT), segment_size)
+            },
+            set(self.server.ranges),
+        )
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.download(checksum='0' * 64)
+        self.assertFalse(self.dest.exists())
+        self.assertFalse(self.part.exists())
+
+    def test_checksum_mismatch_of_segments(self):
+        with self.assertRaises(ValueError):
+            self.download(checksum='0' * 64, segments=4)
+        self.assertFalse(self.dest.exists())
+        self.assertFalse(self.part.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()